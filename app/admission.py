@@ -0,0 +1,64 @@
+import asyncio
+from typing import Dict
+
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED
+
+
+class Overloaded(Exception):
+    """Raised when a request can't be admitted in time"""
+
+
+class AdmissionController:
+    """Caps concurrent requests of one class, with a bounded FIFO wait queue
+
+    Requests beyond concurrency wait for a slot; once queue_size are already
+    waiting, or a slot doesn't free up within queue_timeout seconds, they are
+    rejected straight away instead of adding to everyone's latency.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(concurrency)
+        self._waiting = 0
+        self.rejected = 0
+        self._in_flight_gauge = ADMISSION_IN_FLIGHT.labels(name)
+        self._queue_gauge = ADMISSION_QUEUE_DEPTH.labels(name)
+        self._rejected = ADMISSION_REJECTED.labels(name)
+
+    async def acquire(self):
+        if self._slots.locked():
+            if self._waiting >= self.queue_size:
+                self._reject()
+                raise Overloaded(self.name)
+            self._waiting += 1
+            self._queue_gauge.set(self._waiting)
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject()
+                raise Overloaded(self.name) from None
+            finally:
+                self._waiting -= 1
+                self._queue_gauge.set(self._waiting)
+        else:
+            await self._slots.acquire()
+        self._in_flight_gauge.inc()
+
+    def _reject(self):
+        self.rejected += 1
+        self._rejected.inc()
+
+    def release(self):
+        self._in_flight_gauge.dec()
+        self._slots.release()
+
+    def stats(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "waiting": self._waiting,
+            "rejected": self.rejected,
+        }
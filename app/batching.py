@@ -0,0 +1,115 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Type
+
+from deadline import detach, within_deadline
+
+
+class InsertBatcher:
+    """Groups concurrent single-row inserts into one multi-row INSERT
+
+    Rows submitted within `window` seconds of the first pending row (or until
+    `max_rows` are pending) are written with one insert_many call. If that
+    statement fails with one of `row_errors`, which a single bad row can
+    cause, the batch is retried row by row with insert_one so only the
+    offending rows fail; any other error fails the whole batch.
+
+    Batches are written under no request's deadline. Each caller waits only
+    until its own, and a row whose caller gave up before it was written,
+    including during the row-by-row retry, is left out.
+    """
+
+    def __init__(
+        self,
+        insert_many: Callable[[List[Tuple]], Awaitable[List[int]]],
+        insert_one: Callable[[Tuple], Awaitable[int]],
+        window: float = 0.002,
+        max_rows: int = 500,
+        row_errors: Tuple[Type[Exception], ...] = (),
+    ):
+        self.insert_many = insert_many
+        self.insert_one = insert_one
+        self.window = window
+        self.max_rows = max_rows
+        self.row_errors = row_errors
+        self._pending: List[Tuple[Tuple, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushes: Set[asyncio.Task] = set()
+        self.batches = 0
+        self.rows = 0
+        self.fallbacks = 0
+
+    async def submit(self, row: Tuple) -> int:
+        """Queue a row and wait for its generated id"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        entry = (row, future)
+        self._pending.append(entry)
+        if len(self._pending) >= self.max_rows:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        try:
+            return await within_deadline(future, "query")
+        except BaseException:
+            if entry in self._pending:
+                self._pending.remove(entry)
+            raise
+
+    async def close(self):
+        """Write anything still pending and wait for in-flight batches"""
+        self._flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "rows_per_batch": self.rows / self.batches if self.batches else 0.0,
+            "fallbacks": self.fallbacks,
+        }
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = detach(self._write(batch))
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _write(self, batch: List[Tuple[Tuple, asyncio.Future]]):
+        self.batches += 1
+        self.rows += len(batch)
+        try:
+            ids = await self.insert_many([row for row, _ in batch])
+        except Exception as exc:
+            if len(batch) == 1 or not isinstance(exc, self.row_errors):
+                for _, future in batch:
+                    _resolve(future, exception=exc)
+                return
+            # Isolate the failing rows instead of failing the whole batch
+            self.fallbacks += 1
+            for row, future in batch:
+                if future.done():
+                    # Its caller was already told the write failed
+                    continue
+                try:
+                    _resolve(future, await self.insert_one(row))
+                except Exception as row_exc:
+                    _resolve(future, exception=row_exc)
+            return
+        for (_, future), task_id in zip(batch, ids):
+            _resolve(future, task_id)
+
+
+def _resolve(future: asyncio.Future, result=None, exception: Optional[BaseException] = None):
+    """Complete a caller's future unless the caller already gave up"""
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
@@ -0,0 +1,292 @@
+"""Load and latency benchmark for the Task API
+
+Two modes:
+
+    inproc    drive the ASGI app in-process against the in-memory storage
+              backend, isolating framework, validation and serialization cost
+    postgres  drive the ASGI app in-process against the Postgres database
+              at DATABASE_URL (migrated and seeded before the run)
+
+Each scenario issues --requests requests from --concurrency workers and
+reports throughput and p50/p95/p99 latency. Results can be saved as JSON and
+compared with a previous run:
+
+    python app/benchmarks/load.py --mode inproc --output baseline.json
+    python app/benchmarks/load.py --mode inproc --compare baseline.json --threshold 0.15
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from httpx import AsyncClient
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import main
+from memory import MemoryBackend
+
+
+@dataclass
+class Scenario:
+    name: str
+    request: Callable[[AsyncClient, int], Awaitable]
+    expected_status: int = 200
+
+
+RECORD_STATES = ("CA", "NY", "TX", "WA", "IL")
+
+
+class Context:
+    """Ids and payloads prepared before the timed runs"""
+
+    def __init__(self, args):
+        self.args = args
+        self.description = "x" * args.payload_size
+        self.read_ids: List[int] = []
+        self.write_ids: List[int] = []
+        self.delete_ids: List[int] = []
+        self.record_ids: List[int] = []
+        # Shared by the change feed scenario's requests, which page on from each other's cursors
+        self.change_cursor: Optional[str] = None
+        self.etag: Optional[str] = None
+
+    async def seed(self, client: AsyncClient):
+        async def create(count: int) -> List[int]:
+            ids = []
+            for start in range(0, count, 1000):
+                batch = [{"title": f"Seed {i}", "description": self.description}
+                         for i in range(start, min(count, start + 1000))]
+                response = await client.post("/tasks/bulk", json=batch)
+                response.raise_for_status()
+                ids.extend(response.json()["ids"])
+            return ids
+
+        self.read_ids = await create(self.args.seed)
+        self.write_ids = await create(self.args.requests)
+        # Each delete request consumes its own task
+        self.delete_ids = await create(self.args.requests + self.args.bulk_size * self.args.requests)
+        self.etag = (await client.get(f"/tasks/{self.read_ids[0]}")).headers.get("ETag")
+        for i in range(self.args.seed_records):
+            response = await client.post("/records", json={
+                "name": f"Person {i}",
+                "city": f"City {i % 50}",
+                "state": RECORD_STATES[i % len(RECORD_STATES)],
+                "occupation": f"Job {i % 20}",
+            })
+            response.raise_for_status()
+            self.record_ids.append(response.json()["id"])
+
+
+def build_scenarios(ctx: Context) -> List[Scenario]:
+    args = ctx.args
+
+    def task_body(i: int) -> dict:
+        return {"title": f"Task {i}", "description": ctx.description, "completed": i % 2 == 0}
+
+    def bulk(i: int) -> List[dict]:
+        return [task_body(i * args.bulk_size + j) for j in range(args.bulk_size)]
+
+    def batch(i: int) -> dict:
+        """A client sync: alternating creates and patches, as one atomic batch"""
+        operations = []
+        for j in range(args.bulk_size):
+            if j % 2 == 0:
+                operations.append({"op": "create", "task": task_body(i * args.bulk_size + j)})
+            else:
+                task_id = ctx.write_ids[(i * args.bulk_size + j) % len(ctx.write_ids)]
+                operations.append({"op": "patch", "id": task_id, "changes": {"completed": j % 4 == 1}})
+        return {"operations": operations}
+
+    async def follow_changes(c: AsyncClient, i: int):
+        """Page through the change feed like a syncing client, starting over after the last page"""
+        params = {"limit": args.page_size}
+        if ctx.change_cursor:
+            params["since"] = ctx.change_cursor
+        response = await c.get("/tasks/changes", params=params)
+        if response.status_code == 200:
+            page = response.json()
+            ctx.change_cursor = page["cursor"] if page["has_more"] else None
+        return response
+
+    def records_page(i: int) -> str:
+        """A keyset page starting at a different cursor each time"""
+        after_id = ctx.record_ids[(i * args.page_size) % len(ctx.record_ids)] if ctx.record_ids else 0
+        return f"/records?after_id={after_id}&limit={args.page_size}"
+
+    def bulk_delete_ids(i: int) -> List[int]:
+        offset = args.requests + i * args.bulk_size
+        return ctx.delete_ids[offset:offset + args.bulk_size]
+
+    return [
+        Scenario("health", lambda c, i: c.get("/health")),
+        Scenario("stats", lambda c, i: c.get("/stats")),
+        Scenario("task_stats", lambda c, i: c.get("/tasks/stats")),
+        Scenario("list_tasks", lambda c, i: c.get(f"/tasks?limit={args.page_size}")),
+        Scenario("list_tasks_projected", lambda c, i: c.get(f"/tasks?limit={args.page_size}&fields=title,completed")),
+        Scenario("list_tasks_filtered", lambda c, i: c.get(f"/tasks?limit={args.page_size}&completed=false")),
+        Scenario("task_changes", follow_changes),
+        Scenario("get_task", lambda c, i: c.get(f"/tasks/{ctx.read_ids[i % len(ctx.read_ids)]}")),
+        Scenario(
+            "get_task_not_modified",
+            lambda c, i: c.get(f"/tasks/{ctx.read_ids[0]}", headers={"If-None-Match": ctx.etag or ""}),
+            expected_status=304,
+        ),
+        Scenario("list_records", lambda c, i: c.get(records_page(i))),
+        Scenario("list_records_filtered", lambda c, i: c.get(f"/records?state=TX&limit={args.page_size}")),
+        Scenario("record_facets", lambda c, i: c.get("/records/facets")),
+        Scenario("export_ndjson", lambda c, i: c.get("/tasks/export")),
+        Scenario("create_task", lambda c, i: c.post("/tasks", json=task_body(i)), expected_status=201),
+        Scenario("create_tasks_bulk", lambda c, i: c.post("/tasks/bulk", json=bulk(i)), expected_status=201),
+        Scenario("update_task", lambda c, i: c.put(f"/tasks/{ctx.write_ids[i]}", json=task_body(i))),
+        Scenario("patch_task", lambda c, i: c.patch(f"/tasks/{ctx.write_ids[i]}", json={"completed": i % 2 == 1})),
+        Scenario(
+            "update_tasks_bulk",
+            lambda c, i: c.patch("/tasks/bulk", json=[
+                {"id": ctx.write_ids[(i * args.bulk_size + j) % len(ctx.write_ids)], **task_body(j)}
+                for j in range(min(args.bulk_size, len(ctx.write_ids)))
+            ]),
+        ),
+        Scenario("batch", lambda c, i: c.post("/batch", json=batch(i))),
+        Scenario("delete_task", lambda c, i: c.delete(f"/tasks/{ctx.delete_ids[i]}")),
+        Scenario(
+            "delete_tasks_bulk",
+            lambda c, i: c.request("DELETE", "/tasks/bulk", json={"ids": bulk_delete_ids(i)}),
+        ),
+    ]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+async def run_scenario(client: AsyncClient, scenario: Scenario, requests: int, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            response = await scenario.request(client, i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != scenario.expected_status:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "throughput": requests / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p95_ms": percentile(latencies, 0.95) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+    }
+
+
+async def run(args) -> Dict:
+    database = main.db
+    if args.mode == "inproc":
+        main.db = MemoryBackend()
+    else:
+        await main.startup()
+    try:
+        async with AsyncClient(app=main.app, base_url="http://bench") as client:
+            ctx = Context(args)
+            await ctx.seed(client)
+            scenarios = build_scenarios(ctx)
+            if args.scenarios:
+                wanted = set(args.scenarios.split(","))
+                scenarios = [scenario for scenario in scenarios if scenario.name in wanted]
+            results = {}
+            for scenario in scenarios:
+                results[scenario.name] = await run_scenario(client, scenario, args.requests, args.concurrency)
+    finally:
+        if args.mode == "postgres":
+            await main.shutdown()
+        main.db = database
+    return {
+        "meta": {
+            "mode": args.mode,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "payload_size": args.payload_size,
+            "page_size": args.page_size,
+            "bulk_size": args.bulk_size,
+            "python": platform.python_version(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        },
+        "scenarios": results,
+    }
+
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Describe every scenario whose p95 latency or throughput regressed by more than threshold"""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        if before["p95_ms"] and result["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms")
+        if before["throughput"] and result["throughput"] < before["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {before['throughput']:.0f}/s -> {result['throughput']:.0f}/s"
+            )
+    return regressions
+
+
+def print_table(results: Dict):
+    print(f"{'scenario':<24}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, result in results["scenarios"].items():
+        print(f"{name:<24}{result['throughput']:>10.0f}{result['p50_ms']:>10.2f}"
+              f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{result['errors']:>8}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for the Task API")
+    parser.add_argument("--mode", choices=["inproc", "postgres"], default="inproc")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--payload-size", type=int, default=100, help="description length in bytes")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--bulk-size", type=int, default=100, help="tasks per bulk request")
+    parser.add_argument("--seed", type=int, default=1000, help="tasks created before the run")
+    parser.add_argument("--seed-records", type=int, default=500, help="records created before the run")
+    parser.add_argument("--scenarios", help="comma-separated scenario names (default: all)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed regression, as a fraction")
+    return parser.parse_args(argv)
+
+
+def cli(argv=None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    print_table(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+    if args.compare:
+        regressions = compare(results, json.loads(Path(args.compare).read_text()), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(cli())
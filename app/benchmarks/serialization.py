@@ -0,0 +1,68 @@
+"""Microbenchmark: per-row CPU cost of rendering task lists
+
+Compares FastAPI's default response path (validate against response_model,
+dump to JSON-compatible Python, json.dumps) with the ORJSONResponse path
+used by GET /tasks and GET /tasks/{id}.
+
+    python app/benchmarks/serialization.py --rows 1000
+"""
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from main import Task
+
+
+def make_rows(count: int, description_size: int) -> List[dict]:
+    """Build rows shaped like Database.get_all_tasks results"""
+    return [
+        {
+            "id": i,
+            "title": f"Task {i}",
+            "description": "x" * description_size,
+            "completed": i % 2 == 0,
+            "version": 1,
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--description-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows, args.description_size)
+    adapter = TypeAdapter(List[Task])
+
+    def validated():
+        # What FastAPI does for response_model=List[Task]
+        content = adapter.dump_python(adapter.validate_python(rows), mode="json")
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+    def fast():
+        return orjson.dumps(rows)
+
+    assert json.loads(validated()) == json.loads(fast())
+
+    results = {}
+    for name, fn in (("validated", validated), ("orjson", fast)):
+        best = min(timeit.repeat(fn, number=1, repeat=args.repeat))
+        results[name] = best / args.rows * 1e6
+        print(f"{name:>10}: {best * 1e3:8.2f} ms per {args.rows} rows, {results[name]:6.2f} us/row")
+    print(f"{'saved':>10}: {results['validated'] - results['orjson']:6.2f} us/row "
+          f"({results['validated'] / results['orjson']:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
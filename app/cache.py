@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Bounded in-process LRU cache whose entries expire after a fixed TTL
+
+    Not thread-safe: it is only touched from the event loop thread.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        # Bumped on every invalidation so reads that raced a write don't repopulate stale data
+        self._stamp = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stamp(self) -> int:
+        """Return a token to pass to set() for values read from the database"""
+        return self._stamp
+
+    def get(self, key: Hashable) -> Optional[object]:
+        """Return the cached value, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: object, stamp: Optional[int] = None):
+        """Store a value, skipping it if anything was invalidated since stamp was taken"""
+        if not self.enabled or (stamp is not None and stamp != self._stamp):
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        """Drop a single entry"""
+        self._stamp += 1
+        self.invalidations += 1
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        self._stamp += 1
+        self.invalidations += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Return counters used to tune the cache size and TTL"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+import time
+from contextvars import ContextVar
+from typing import Awaitable, Coroutine, Optional, TypeVar
+
+from metrics import DEADLINE_EXCEEDED
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed while it was waiting on the database"""
+
+
+T = TypeVar("T")
+
+# Set by DeadlineMiddleware to the time.monotonic() the request must finish by; None means no deadline
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+
+def deadline_exceeded(stage: str) -> DeadlineExceeded:
+    """Count an expired deadline by what was being waited for, returning the exception to raise"""
+    DEADLINE_EXCEEDED.labels(stage).inc()
+    return DeadlineExceeded(stage)
+
+
+def time_left(stage: str) -> Optional[float]:
+    """Seconds until the current deadline, or None without one
+
+    Raises DeadlineExceeded, counted against stage, once it has passed.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise deadline_exceeded(stage)
+    return left
+
+
+def detach(coro: Coroutine) -> asyncio.Task:
+    """Start coro as a task outside every request's context
+
+    For work shared by several requests or done on their behalf in the
+    background, which no single request's deadline or timing should cover.
+    """
+    return contextvars.Context().run(asyncio.ensure_future, coro)
+
+
+async def within_deadline(awaitable: Awaitable[T], stage: str) -> T:
+    """Await awaitable for no longer than what is left of the current deadline
+
+    The awaitable is cancelled when the deadline passes; shield shared work.
+    """
+    timeout = time_left(stage)
+    if timeout is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise deadline_exceeded(stage) from None
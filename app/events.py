@@ -0,0 +1,168 @@
+import asyncio
+import secrets
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Set
+
+from metrics import TASK_STREAM_EVICTIONS, TASK_STREAM_SUBSCRIBERS
+
+# Notification ops from the tasks_notify trigger, as event names
+EVENT_NAMES = {"INSERT": "created", "UPDATE": "updated", "DELETE": "deleted"}
+
+
+class Event(NamedTuple):
+    id: str
+    name: str
+    task_id: Optional[int]
+
+
+class TooManySubscribers(Exception):
+    """Raised when the broker is already at max_subscribers"""
+
+
+class Subscriber:
+    """One stream's pending events; evicted instead of growing past max_pending"""
+
+    __slots__ = ("pending", "max_pending", "evicted", "_wakeup")
+
+    def __init__(self, max_pending: int):
+        self.pending: Deque[Event] = deque()
+        self.max_pending = max_pending
+        self.evicted = False
+        self._wakeup = asyncio.Event()
+
+    def push(self, event: Event) -> bool:
+        if self.evicted:
+            return False
+        if len(self.pending) >= self.max_pending:
+            self.evicted = True
+            self._wakeup.set()
+            return False
+        self.pending.append(event)
+        self._wakeup.set()
+        return True
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def next_events(self) -> List[Event]:
+        """Wait for events, returning everything pending; empty on keepalive or eviction"""
+        if not self.pending and not self.evicted:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        events = list(self.pending)
+        self.pending.clear()
+        return events
+
+
+class TaskEventBroker:
+    """Fans task changes from the process's ChangeListener out to stream subscribers
+
+    Events get ids of the form <epoch>-<sequence>, where the epoch is random
+    per process, and the last buffer_size events are kept for clients
+    resuming with Last-Event-ID. A client whose id is unknown (too old,
+    another process, a restart) gets a reset event and must refetch.
+    Subscribers that fall queue_size events behind are evicted; they can
+    reconnect and resume from the buffer.
+    """
+
+    def __init__(
+        self,
+        buffer_size: int = 1000,
+        queue_size: int = 100,
+        max_subscribers: int = 10000,
+        keepalive_interval: float = 15.0,
+    ):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.keepalive_interval = keepalive_interval
+        self.epoch = secrets.token_hex(4)
+        self._sequence = 0
+        self._history: Deque[Event] = deque(maxlen=buffer_size)
+        self._subscribers: Set[Subscriber] = set()
+        self._keepalive: Optional[asyncio.Task] = None
+        self.events = 0
+        self.evictions = 0
+
+    @property
+    def full(self) -> bool:
+        return len(self._subscribers) >= self.max_subscribers
+
+    def publish(self, op: str, task_id: int):
+        """ChangeListener change callback"""
+        self._append(EVENT_NAMES.get(op, op.lower()), task_id)
+
+    def reset(self):
+        """ChangeListener reset callback: changes may have been missed, so subscribers must refetch"""
+        self._append("reset", None)
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscriber:
+        if self.full:
+            raise TooManySubscribers()
+        subscriber = Subscriber(self.queue_size)
+        if last_event_id:
+            for event in self._replay(last_event_id):
+                if not subscriber.push(event):
+                    # Too far behind to replay; start afresh instead
+                    subscriber = Subscriber(self.queue_size)
+                    subscriber.push(self._reset_event())
+                    break
+        self._subscribers.add(subscriber)
+        TASK_STREAM_SUBSCRIBERS.set(len(self._subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        TASK_STREAM_SUBSCRIBERS.set(len(self._subscribers))
+
+    async def start(self):
+        """Start waking idle subscribers so their streams send keepalives"""
+        if self._keepalive is None:
+            self._keepalive = asyncio.create_task(self._send_keepalives())
+
+    async def stop(self):
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+            try:
+                await self._keepalive
+            except asyncio.CancelledError:
+                pass
+            self._keepalive = None
+
+    def stats(self) -> Dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "events": self.events,
+            "evictions": self.evictions,
+            "buffered": len(self._history),
+        }
+
+    def _append(self, name: str, task_id: Optional[int]):
+        self._sequence += 1
+        self.events += 1
+        event = Event(f"{self.epoch}-{self._sequence}", name, task_id)
+        self._history.append(event)
+        for subscriber in self._subscribers:
+            if not subscriber.evicted and not subscriber.push(event):
+                self.evictions += 1
+                TASK_STREAM_EVICTIONS.inc()
+
+    def _replay(self, last_event_id: str) -> List[Event]:
+        """Buffered events after last_event_id, or a single reset event if it can't be resumed from"""
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch == self.epoch and sequence.isdigit():
+            last_sequence = int(sequence)
+            oldest = self._sequence - len(self._history) + 1
+            # Resumable only if nothing between last_sequence and the buffer was dropped
+            if oldest <= last_sequence + 1 and last_sequence <= self._sequence:
+                return list(self._history)[last_sequence - oldest + 1:]
+        return [self._reset_event()]
+
+    def _reset_event(self) -> Event:
+        # Not buffered; the id lets the client resume from this point
+        return Event(f"{self.epoch}-{self._sequence}", "reset", None)
+
+    async def _send_keepalives(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            for subscriber in self._subscribers:
+                subscriber.wake()
@@ -1,11 +1,113 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError, field_validator, model_validator
+from datetime import datetime
+from typing import AsyncIterator, List, Literal, Optional, Tuple
+import base64
+import binascii
+import csv
+import hashlib
+import io
+import orjson
 import os
-from db import Database
+import metrics
+from admission import AdmissionController
+from db import PoolTimeoutError
+from deadline import DeadlineExceeded
+from events import Event, TaskEventBroker, TooManySubscribers
+from middleware import (
+    AdmissionControlMiddleware,
+    ClientIdentityMiddleware,
+    DeadlineMiddleware,
+    MetricsMiddleware,
+    ServerTimingMiddleware,
+)
+from storage import TASK_COLUMNS, CursorExpiredError, create_backend
 
 app = FastAPI(title="Task API", version="1.0.0")
-db = Database()
+# Postgres unless STORAGE_BACKEND says otherwise
+db = create_backend()
+# Read at scrape time, from whichever backend is current
+metrics.DB_POOL_CONNECTIONS.callback = lambda: db.pool_connections()
+
+# Live task events for GET /tasks/stream, fed by the backend's change notifications
+events = TaskEventBroker(
+    buffer_size=int(os.getenv("TASK_STREAM_BUFFER", "1000")),
+    queue_size=int(os.getenv("TASK_STREAM_QUEUE_SIZE", "100")),
+    max_subscribers=int(os.getenv("TASK_STREAM_MAX_SUBSCRIBERS", "10000")),
+    keepalive_interval=float(os.getenv("TASK_STREAM_KEEPALIVE", "15")),
+)
+STREAM_ENABLED = db.subscribe_changes(events.publish, events.reset)
+
+# Seconds clients are told to back off for when a request is shed
+RETRY_AFTER_SECONDS = int(os.getenv("RETRY_AFTER_SECONDS", "1"))
+
+app.add_middleware(
+    ClientIdentityMiddleware,
+    trust_forwarded=os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true",
+)
+if os.getenv("ADMISSION_CONTROL", "true").lower() == "true":
+    # By default each endpoint class may keep the whole pool busy, and no more
+    queue_timeout = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "1"))
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        read=AdmissionController(
+            "read",
+            concurrency=int(os.getenv("ADMISSION_READ_CONCURRENCY", str(db.pool_max_size))),
+            queue_size=int(os.getenv("ADMISSION_READ_QUEUE", "100")),
+            queue_timeout=queue_timeout,
+        ),
+        write=AdmissionController(
+            "write",
+            concurrency=int(os.getenv("ADMISSION_WRITE_CONCURRENCY", str(db.pool_max_size))),
+            queue_size=int(os.getenv("ADMISSION_WRITE_QUEUE", "50")),
+            queue_timeout=queue_timeout,
+        ),
+        retry_after=RETRY_AFTER_SECONDS,
+        # Streams stay open indefinitely and would hold a read slot throughout
+        exempt_paths=["/", "/health", "/metrics", "/stats", "/tasks/stream"],
+        # Exports hold a connection for the whole download, so a few get slots of their own
+        path_controllers={
+            "/tasks/export": AdmissionController(
+                "export",
+                concurrency=int(os.getenv("ADMISSION_EXPORT_CONCURRENCY", str(max(1, db.pool_max_size // 4)))),
+                queue_size=int(os.getenv("ADMISSION_EXPORT_QUEUE", "10")),
+                queue_timeout=queue_timeout,
+            ),
+        },
+    )
+# Seconds a request may wait on the database before failing with 504; 0 disables deadlines
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "10"))
+if REQUEST_TIMEOUT > 0:
+    # Outside admission control, so time spent queued counts against the deadline
+    app.add_middleware(
+        DeadlineMiddleware,
+        default=REQUEST_TIMEOUT,
+        max_timeout=float(os.getenv("REQUEST_TIMEOUT_MAX", "30")),
+        # Streams and exports last as long as the client keeps reading
+        route_timeouts={
+            "/tasks/stream": None,
+            "/tasks/export": None,
+            "/tasks/bulk": float(os.getenv("REQUEST_TIMEOUT_BULK", "60")),
+            "/batch": float(os.getenv("REQUEST_TIMEOUT_BULK", "60")),
+        },
+    )
+if os.getenv("SERVER_TIMING", "true").lower() == "true":
+    app.add_middleware(ServerTimingMiddleware)
+# Outermost, so the recorded latency covers every other middleware
+app.add_middleware(MetricsMiddleware)
+
+DEFAULT_PAGE_SIZE = int(os.getenv("TASKS_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("TASKS_MAX_PAGE_SIZE", "1000"))
+EXPORT_BATCH_SIZE = int(os.getenv("TASKS_EXPORT_BATCH_SIZE", "1000"))
+BULK_MAX_BATCH = int(os.getenv("TASKS_BULK_MAX_BATCH", "10000"))
+BULK_VALIDATE_CHUNK = 1000
+BATCH_MAX_OPERATIONS = int(os.getenv("TASKS_BATCH_MAX_OPERATIONS", "1000"))
+# Production deploys run `python migrate.py` as a deploy step and turn this off
+SCHEMA_AUTO_MIGRATE = os.getenv("SCHEMA_AUTO_MIGRATE", "true").lower() == "true"
+
+TASK_FIELDS = ["id", "title", "description", "completed"]
 
 
 class Task(BaseModel):
@@ -13,18 +115,245 @@ class Task(BaseModel):
     title: str
     description: Optional[str] = None
     completed: bool = False
+    # Read-only; bumped on every update. Send it back in If-Match via the ETag header.
+    version: Optional[int] = None
+
+
+class TaskPatch(BaseModel):
+    """Fields to change; omitted fields keep their current value"""
+    title: Optional[str] = None
+    description: Optional[str] = None
+    completed: Optional[bool] = None
+
+    @field_validator("title", "completed")
+    @classmethod
+    def _not_null(cls, value):
+        # Only runs for fields that were sent
+        if value is None:
+            raise ValueError("may be omitted but not null")
+        return value
+
+
+class Record(BaseModel):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    occupation: Optional[str] = None
+
+
+class FacetCount(BaseModel):
+    value: Optional[str]
+    count: int
+
+
+class RecordFacets(BaseModel):
+    state: List[FacetCount]
+    occupation: List[FacetCount]
+
+
+class BulkCreateResult(BaseModel):
+    ids: List[int]
+
+
+class BulkTaskUpdate(BaseModel):
+    id: int
+    title: str
+    description: Optional[str] = None
+    completed: bool = False
+
+
+class BulkDelete(BaseModel):
+    ids: List[int]
+
+
+class BulkItemResult(BaseModel):
+    id: int
+    status: Literal["updated", "deleted", "not_found"]
+
+
+class BulkResult(BaseModel):
+    results: List[BulkItemResult]
+
+
+class TaskChanges(BaseModel):
+    changes: List[Task]
+    deleted: List[int]
+    cursor: str
+    has_more: bool
+
+
+class TaskStats(BaseModel):
+    total: int
+    completed: int
+    open: int
+
+
+class BatchOperation(BaseModel):
+    """One task write; with a version, only if the task is still at it, like If-Match"""
+    op: Literal["create", "update", "patch", "delete"]
+    id: Optional[int] = None
+    # The whole task, for create and update
+    task: Optional[Task] = None
+    changes: Optional[TaskPatch] = None
+    version: Optional[int] = None
+
+    @model_validator(mode="after")
+    def _check_fields(self):
+        if self.op != "create" and self.id is None:
+            raise ValueError(f"{self.op} needs an id")
+        if self.op in ("create", "update") and self.task is None:
+            raise ValueError(f"{self.op} needs a task")
+        if self.op == "patch" and not (self.changes and self.changes.model_fields_set):
+            raise ValueError("patch needs changes")
+        return self
+
+
+class BatchRequest(BaseModel):
+    # atomic commits all operations or none; continue skips the ones that fail
+    mode: Literal["atomic", "continue"] = "atomic"
+    operations: List[BatchOperation]
+
+
+class BatchOperationResult(BaseModel):
+    status: int
+    id: Optional[int] = None
+    task: Optional[Task] = None
+    detail: Optional[str] = None
+
+
+class BatchResult(BaseModel):
+    committed: bool
+    results: List[BatchOperationResult]
+
+
+_task_list = TypeAdapter(List[Task])
+
+
+def _task_etag(task: dict, fields: Optional[Tuple[str, ...]] = None) -> Optional[str]:
+    """Strong ETag for a single task, derived from its id and version, and the projection if any"""
+    version = task.get("version")
+    if version is None:
+        return None
+    if fields is None:
+        return f'"{task["id"]}.{version}"'
+    # A projection is a different representation, so it needs its own tag
+    projection = hashlib.blake2b(",".join(fields).encode(), digest_size=4).hexdigest()
+    return f'"{task["id"]}.{version}-{projection}"'
+
+
+def _list_etag(tasks: List[dict], next_cursor: Optional[str], fields: Optional[Tuple[str, ...]] = None) -> Optional[str]:
+    """Strong ETag for a page of tasks, hashed from ids and versions instead of the body"""
+    digest = hashlib.blake2b(digest_size=16)
+    if fields is not None:
+        digest.update(",".join(fields).encode() + b"|")
+    for task in tasks:
+        version = task.get("version")
+        if version is None:
+            return None
+        digest.update(f"{task['id']}.{version};".encode())
+    digest.update((next_cursor or "").encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match or etag is None:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def _expected_version(if_match: Optional[str], task_id: int) -> Optional[int]:
+    """Version required by an If-Match header, or None when any version will do"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    for candidate in if_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith('"') and candidate.endswith('"'):
+            etag_id, _, version = candidate[1:-1].partition(".")
+            # Tags of projections carry the same version
+            version = version.partition("-")[0]
+            if etag_id == str(task_id) and version.isdigit():
+                return int(version)
+    # Weak or foreign ETags can never match strongly
+    raise HTTPException(status_code=412, detail="Precondition failed")
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Validate a ?fields= projection against the task columns; id is always included"""
+    if fields is None:
+        return None
+    requested = ["id"]
+    for field in fields.split(","):
+        field = field.strip()
+        if field not in TASK_COLUMNS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown field {field!r}; choose from {', '.join(TASK_COLUMNS)}",
+            )
+        if field not in requested:
+            requested.append(field)
+    return tuple(requested)
+
+
+def _project(task: dict, fields: Optional[Tuple[str, ...]]) -> dict:
+    return task if fields is None else {field: task[field] for field in fields}
+
+
+def _encode_change_cursor(position: Tuple[int, int]) -> str:
+    """Opaque change-feed cursor for a (change_xid, id) position"""
+    return base64.urlsafe_b64encode(f"{position[0]}.{position[1]}".encode()).decode().rstrip("=")
+
+
+def _decode_change_cursor(cursor: str) -> Tuple[int, int]:
+    try:
+        decoded = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        change_xid, change_id = decoded.split(".")
+        return int(change_xid), int(change_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def _raise_not_found_or_conflict(task_id: int, expected_version: Optional[int]):
+    """Explain a failed conditional write: the task is gone, or it has moved on"""
+    if expected_version is not None and await db.get_task(task_id) is not None:
+        raise HTTPException(status_code=412, detail="Precondition failed")
+    raise HTTPException(status_code=404, detail="Task not found")
+
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceeded):
+    """The request's deadline passed while it waited for a connection or a statement"""
+    return JSONResponse({"detail": "Request deadline exceeded"}, status_code=504)
+
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    """Every connection stayed busy for the whole acquire timeout"""
+    return JSONResponse(
+        {"detail": "Service overloaded, retry later"},
+        status_code=503,
+        headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+    )
 
 
 @app.on_event("startup")
 async def startup():
     """Initialize database on startup"""
     await db.connect()
-    await db.create_tables()
+    # A single cheap query when the schema is current; migrations normally run as a deploy step
+    if not await db.schema_is_current():
+        if not SCHEMA_AUTO_MIGRATE:
+            raise RuntimeError("Database schema is out of date; run `python migrate.py`")
+        await db.create_tables()
+    await events.start()
 
 
 @app.on_event("shutdown")
 async def shutdown():
     """Close database connection on shutdown"""
+    await events.stop()
     await db.disconnect()
 
 
@@ -40,44 +369,481 @@ async def health():
     return {"status": "healthy", "service": "Task API"}
 
 
+@app.get("/stats")
+async def stats():
+    """In-process cache counters, for tuning cache size and TTL"""
+    return {**db.stats(), "stream": events.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus metrics: request latency, pool waits and Database method timings"""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/tasks", response_model=List[Task])
-async def get_tasks():
-    """Get all tasks"""
-    tasks = await db.get_all_tasks()
-    return tasks
+async def get_tasks(
+    after_id: Optional[int] = Query(None, ge=0, description="Return tasks with an id greater than this cursor"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    completed: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return; id is always included"),
+    include_archived: bool = Query(False, description="Also return tasks moved to the archive"),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Get a page of tasks; the next page cursor is returned in the X-Next-Cursor header"""
+    projection = _parse_fields(fields)
+    # Fetch one extra row to learn whether another page exists
+    query = {"after_id": after_id, "limit": limit + 1, "completed": completed, "created_after": created_after}
+    if projection is not None:
+        # version backs the ETag whether or not it was asked for
+        query["columns"] = projection if "version" in projection else projection + ("version",)
+    if include_archived:
+        query["include_archived"] = True
+    tasks = await db.get_all_tasks(**query)
+    headers = {}
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        headers["X-Next-Cursor"] = str(tasks[-1]["id"])
+    etag = _list_etag(tasks, headers.get("X-Next-Cursor"), projection)
+    if etag is not None:
+        headers["ETag"] = etag
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    if projection is not None and "version" not in projection:
+        tasks = [_project(task, projection) for task in tasks]
+    # Rows come from our own schema, so skip re-validating them against response_model
+    return ORJSONResponse(tasks, headers=headers)
+
+
+@app.get("/tasks/stats", response_model=TaskStats)
+async def get_task_stats():
+    """Total, completed and open task counts, read from maintained counters in constant time"""
+    return ORJSONResponse(await db.get_task_stats())
+
+
+@app.get("/tasks/changes", response_model=TaskChanges)
+async def get_task_changes(
+    since: Optional[str] = Query(None, description="Cursor from a previous call; omit for a full sync"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """Tasks created or updated, and ids deleted, since a cursor
+
+    Keep polling with the returned cursor; has_more means the next page is
+    ready now. 410 means the cursor outlived tombstone retention and the
+    client must resync without one.
+    """
+    position = _decode_change_cursor(since) if since else (0, 0)
+    try:
+        changes = await db.get_changes(position, limit)
+    except CursorExpiredError:
+        raise HTTPException(status_code=410, detail="Cursor expired; resync without since")
+    return ORJSONResponse({
+        "changes": changes["changes"],
+        "deleted": changes["deleted"],
+        "cursor": _encode_change_cursor(changes["position"]),
+        "has_more": changes["has_more"],
+    })
+
+
+def _sse(event: Event) -> str:
+    data = orjson.dumps({"id": event.task_id}).decode() if event.task_id is not None else "{}"
+    return f"id: {event.id}\nevent: {event.name}\ndata: {data}\n\n"
+
+
+async def _sse_events(last_event_id: Optional[str]) -> AsyncIterator[str]:
+    """Render a subscriber's events as Server-Sent Events until it is evicted or disconnects"""
+    try:
+        subscriber = events.subscribe(last_event_id)
+    except TooManySubscribers:
+        # Filled up between the capacity check and the stream starting
+        yield "event: evicted\ndata: {}\n\n"
+        return
+    try:
+        while True:
+            batch = await subscriber.next_events()
+            if batch:
+                yield "".join(_sse(event) for event in batch)
+            elif subscriber.evicted:
+                yield "event: evicted\ndata: {}\n\n"
+                return
+            else:
+                yield ": keepalive\n\n"
+    finally:
+        events.unsubscribe(subscriber)
+
+
+@app.get("/tasks/stream")
+async def stream_tasks(last_event_id: Optional[str] = Header(None)):
+    """Server-Sent Events for task changes: created, updated and deleted, each with the task id
+
+    A reset event means changes may have been missed and the client should
+    refetch. Reconnecting with Last-Event-ID resumes from the buffered events.
+    """
+    if not STREAM_ENABLED:
+        raise HTTPException(status_code=503, detail="Task change stream is disabled")
+    if events.full:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many stream subscribers",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+    return StreamingResponse(
+        _sse_events(last_event_id),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _ndjson_lines(batches: AsyncIterator[List[dict]]) -> AsyncIterator[bytes]:
+    """Render task batches as newline-delimited JSON"""
+    async for batch in batches:
+        yield b"".join(orjson.dumps(task) + b"\n" for task in batch)
+
+
+async def _csv_lines(batches: AsyncIterator[List[dict]]) -> AsyncIterator[str]:
+    """Render task batches as CSV, starting with the header row"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=TASK_FIELDS)
+    writer.writeheader()
+    yield buffer.getvalue()
+    async for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue()
+
+
+@app.get("/tasks/export")
+async def export_tasks(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    completed: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+    include_archived: bool = False,
+):
+    """Stream every task as NDJSON or CSV without loading the table into memory"""
+    batches = db.iter_tasks(
+        batch_size=EXPORT_BATCH_SIZE,
+        completed=completed,
+        created_after=created_after,
+        include_archived=include_archived,
+    )
+    if format == "csv":
+        return StreamingResponse(
+            _csv_lines(batches),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="tasks.csv"'},
+        )
+    return StreamingResponse(_ndjson_lines(batches), media_type="application/x-ndjson")
+
+
+def _validate_tasks(items: list, offset: int) -> List[Task]:
+    """Validate a chunk of raw bulk items, reporting errors by their position in the request"""
+    try:
+        return _task_list.validate_python(items)
+    except ValidationError as exc:
+        errors = exc.errors()
+        for error in errors:
+            error["loc"] = ("body", offset + error["loc"][0], *error["loc"][1:])
+        raise RequestValidationError(errors)
+
+
+async def _read_bulk_items(request: Request) -> AsyncIterator[object]:
+    """Yield raw items from a JSON array body or, incrementally, from an NDJSON stream"""
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            pending = b""
+            async for chunk in request.stream():
+                *lines, pending = (pending + chunk).split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        yield orjson.loads(line)
+            if pending.strip():
+                yield orjson.loads(pending)
+        else:
+            items = orjson.loads(await request.body())
+            if not isinstance(items, list):
+                raise HTTPException(status_code=400, detail="Expected a JSON array of tasks")
+            for item in items:
+                yield item
+    except orjson.JSONDecodeError as exc:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {exc}")
+
+
+@app.post(
+    "/tasks/bulk",
+    response_model=BulkCreateResult,
+    status_code=201,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"$ref": "#/components/schemas/Task"}}
+                },
+                "application/x-ndjson": {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def create_tasks_bulk(request: Request):
+    """Create many tasks from a JSON array or NDJSON stream; ids are returned in input order"""
+    tasks: List[Task] = []
+    pending = []
+    async for item in _read_bulk_items(request):
+        pending.append(item)
+        if len(tasks) + len(pending) > BULK_MAX_BATCH:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Bulk requests are limited to {BULK_MAX_BATCH} tasks",
+            )
+        if len(pending) == BULK_VALIDATE_CHUNK:
+            tasks.extend(_validate_tasks(pending, len(tasks)))
+            pending = []
+    tasks.extend(_validate_tasks(pending, len(tasks)))
+    if not tasks:
+        return {"ids": []}
+
+    ids = await db.create_tasks([(task.title, task.description, task.completed) for task in tasks])
+    return {"ids": ids}
+
+
+def _check_bulk_ids(ids: List[int]):
+    """Reject bulk id sets that are too large or contain duplicates"""
+    if len(ids) > BULK_MAX_BATCH:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Bulk requests are limited to {BULK_MAX_BATCH} tasks",
+        )
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=422, detail="Duplicate task ids in bulk request")
+
+
+@app.patch("/tasks/bulk", response_model=BulkResult)
+async def update_tasks_bulk(tasks: List[BulkTaskUpdate]):
+    """Update many tasks by id, reporting which ids were not found"""
+    ids = [task.id for task in tasks]
+    _check_bulk_ids(ids)
+    updated = set(await db.update_tasks(
+        [(task.id, task.title, task.description, task.completed) for task in tasks]
+    )) if tasks else set()
+    return {"results": [
+        {"id": task_id, "status": "updated" if task_id in updated else "not_found"}
+        for task_id in ids
+    ]}
+
+
+@app.delete("/tasks/bulk", response_model=BulkResult)
+async def delete_tasks_bulk(request: BulkDelete):
+    """Delete many tasks by id, reporting which ids were not found"""
+    _check_bulk_ids(request.ids)
+    deleted = set(await db.delete_tasks(request.ids)) if request.ids else set()
+    return {"results": [
+        {"id": task_id, "status": "deleted" if task_id in deleted else "not_found"}
+        for task_id in request.ids
+    ]}
 
 
 @app.get("/tasks/{task_id}", response_model=Task)
-async def get_task(task_id: int):
+async def get_task(
+    task_id: int,
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return; id is always included"),
+    include_archived: bool = Query(False, description="Fall back to the archive when the task isn't live"),
+    if_none_match: Optional[str] = Header(None),
+):
     """Get a specific task by ID"""
+    projection = _parse_fields(fields)
+    # Served whole from the task cache, then narrowed
     task = await db.get_task(task_id)
+    if not task and include_archived:
+        task = await db.get_archived_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    return task
+    etag = _task_etag(task, projection)
+    headers = {"ETag": etag} if etag else {}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    return ORJSONResponse(_project(task, projection), headers=headers)
 
 
 @app.post("/tasks", response_model=Task, status_code=201)
-async def create_task(task: Task):
+async def create_task(task: Task, response: Response):
     """Create a new task"""
     task_id = await db.create_task(task.title, task.description, task.completed)
     task.id = task_id
+    # New rows start at the column default
+    task.version = 1
+    response.headers["ETag"] = _task_etag(task.model_dump())
     return task
 
 
 @app.put("/tasks/{task_id}", response_model=Task)
-async def update_task(task_id: int, task: Task):
-    """Update an existing task"""
-    updated = await db.update_task(task_id, task.title, task.description, task.completed)
-    if not updated:
-        raise HTTPException(status_code=404, detail="Task not found")
+async def update_task(
+    task_id: int,
+    task: Task,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+):
+    """Update an existing task; with If-Match, only if it hasn't changed since that ETag"""
+    expected_version = _expected_version(if_match, task_id)
+    if expected_version is None:
+        version = await db.update_task(task_id, task.title, task.description, task.completed)
+    else:
+        version = await db.update_task(
+            task_id, task.title, task.description, task.completed,
+            expected_version=expected_version,
+        )
+    if version is None:
+        await _raise_not_found_or_conflict(task_id, expected_version)
     task.id = task_id
+    task.version = version
+    response.headers["ETag"] = _task_etag(task.model_dump())
     return task
 
 
+@app.patch("/tasks/{task_id}", response_model=Task)
+async def patch_task(task_id: int, patch: TaskPatch, if_match: Optional[str] = Header(None)):
+    """Change only the fields sent; with If-Match, only if the task hasn't changed since that ETag"""
+    expected_version = _expected_version(if_match, task_id)
+    changes = patch.model_dump(exclude_unset=True)
+    if not changes:
+        task = await db.get_task(task_id)
+        if task and expected_version is not None and task["version"] != expected_version:
+            raise HTTPException(status_code=412, detail="Precondition failed")
+    else:
+        task = await db.patch_task(task_id, changes, expected_version=expected_version)
+    if not task:
+        await _raise_not_found_or_conflict(task_id, expected_version)
+    return ORJSONResponse(task, headers={"ETag": _task_etag(task)})
+
+
 @app.delete("/tasks/{task_id}")
-async def delete_task(task_id: int):
-    """Delete a task"""
-    deleted = await db.delete_task(task_id)
+async def delete_task(task_id: int, if_match: Optional[str] = Header(None)):
+    """Delete a task; with If-Match, only if it hasn't changed since that ETag"""
+    expected_version = _expected_version(if_match, task_id)
+    if expected_version is None:
+        deleted = await db.delete_task(task_id)
+    else:
+        deleted = await db.delete_task(task_id, expected_version=expected_version)
     if not deleted:
-        raise HTTPException(status_code=404, detail="Task not found")
+        await _raise_not_found_or_conflict(task_id, expected_version)
     return {"message": "Task deleted successfully"}
+
+
+def _batch_operation(operation: BatchOperation) -> dict:
+    """The backend's form of a batch operation"""
+    converted = {"op": operation.op, "id": operation.id, "expected_version": operation.version}
+    if operation.task is not None:
+        converted.update(
+            title=operation.task.title, description=operation.task.description, completed=operation.task.completed
+        )
+    if operation.changes is not None:
+        converted["changes"] = operation.changes.model_dump(exclude_unset=True)
+    return converted
+
+
+def _batch_result(op: str, result: dict) -> dict:
+    """An operation's result with the status code its own endpoint would have answered"""
+    if result["error"] == "not_found":
+        return {"status": 404, "id": result["id"], "detail": "Task not found"}
+    if result["error"] == "version_conflict":
+        return {"status": 412, "id": result["id"], "detail": "Precondition failed"}
+    if result["error"] is not None:
+        return {"status": 422, "id": result["id"], "detail": result.get("detail")}
+    status = {"create": 201, "delete": 204}.get(op, 200)
+    return {"status": status, "id": result["id"], "task": result["task"]}
+
+
+@app.post("/batch", response_model=BatchResult)
+async def run_batch(batch: BatchRequest):
+    """Run task writes in order in one transaction, with a result for each
+
+    An atomic batch that fails answers 409: the failed operation has its
+    error and every other one 424, as none of them took effect.
+    """
+    if len(batch.operations) > BATCH_MAX_OPERATIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batches are limited to {BATCH_MAX_OPERATIONS} operations",
+        )
+    if not batch.operations:
+        return {"committed": True, "results": []}
+    committed, results = await db.run_batch(
+        [_batch_operation(operation) for operation in batch.operations],
+        atomic=batch.mode == "atomic",
+    )
+    if committed:
+        body = [_batch_result(operation.op, result) for operation, result in zip(batch.operations, results)]
+        return ORJSONResponse({"committed": True, "results": body})
+    failed = len(results) - 1
+    body = [
+        _batch_result(operation.op, results[i]) if i == failed
+        else {"status": 424, "id": operation.id, "detail": "Rolled back with the batch"}
+        for i, operation in enumerate(batch.operations)
+    ]
+    return ORJSONResponse({"committed": False, "results": body}, status_code=409)
+
+
+@app.get("/records", response_model=List[Record])
+async def get_records(
+    after_id: Optional[int] = Query(None, ge=0, description="Return records with an id greater than this cursor"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    state: Optional[str] = None,
+    city: Optional[str] = None,
+    occupation: Optional[str] = None,
+):
+    """Get a page of records, optionally filtered; the next page cursor is returned in the X-Next-Cursor header"""
+    records = await db.get_all_test_records(
+        after_id=after_id,
+        limit=limit + 1,
+        state=state,
+        city=city,
+        occupation=occupation,
+    )
+    headers = {}
+    if len(records) > limit:
+        records = records[:limit]
+        headers["X-Next-Cursor"] = str(records[-1]["id"])
+    return ORJSONResponse(records, headers=headers)
+
+
+@app.get("/records/facets", response_model=RecordFacets)
+async def get_record_facets():
+    """Record counts by state and by occupation, largest first"""
+    return ORJSONResponse(await db.get_test_facets())
+
+
+@app.get("/records/{record_id}", response_model=Record)
+async def get_record(record_id: int):
+    """Get a specific record by ID"""
+    record = await db.get_test_record(record_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return ORJSONResponse(record)
+
+
+@app.post("/records", response_model=Record, status_code=201)
+async def create_record(record: Record):
+    """Create a new record"""
+    record.id = await db.create_test_record(record.name, record.city, record.state, record.occupation)
+    return record
+
+
+@app.put("/records/{record_id}", response_model=Record)
+async def update_record(record_id: int, record: Record):
+    """Update an existing record"""
+    updated = await db.update_test_record(record_id, record.name, record.city, record.state, record.occupation)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Record not found")
+    record.id = record_id
+    return record
+
+
+@app.delete("/records/{record_id}")
+async def delete_record(record_id: int):
+    """Delete a record"""
+    deleted = await db.delete_test_record(record_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return {"message": "Record deleted successfully"}
@@ -0,0 +1,588 @@
+import asyncio
+import bisect
+import heapq
+import os
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from metrics import timed
+from storage import PATCHABLE_TASK_COLUMNS, TASK_COLUMNS, CursorExpiredError, StorageBackend, utc_naive
+
+FACET_COLUMNS = ("state", "occupation")
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _check_columns(columns: Sequence[str], allowed: Sequence[str]):
+    unknown = set(columns) - set(allowed)
+    if unknown or not columns:
+        raise ValueError(f"Unknown or unusable columns: {sorted(unknown)}")
+
+
+def _remove_sorted(ids: List[int], removed: Iterable[int]) -> List[int]:
+    """Remove ids from a sorted list, in place for a few and by rebuilding for many"""
+    removed = set(removed)
+    if len(removed) > 32:
+        return [row_id for row_id in ids if row_id not in removed]
+    for row_id in removed:
+        i = bisect.bisect_left(ids, row_id)
+        if i < len(ids) and ids[i] == row_id:
+            del ids[i]
+    return ids
+
+
+class _Row:
+    """A row with one slot per column instead of a dict
+
+    A slot costs one pointer, so a row takes a fraction of a dict's memory,
+    which matters at the millions of rows the benchmarks load.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for column in self.__slots__:
+            setattr(self, column, values[column])
+
+    def __getitem__(self, column: str):
+        return getattr(self, column)
+
+    def __setitem__(self, column: str, value):
+        setattr(self, column, value)
+
+    def replace(self, **changes) -> "_Row":
+        """A copy with some columns changed"""
+        return type(self)(**{**self.as_dict(), **changes})
+
+    def as_dict(self) -> Dict:
+        return {column: getattr(self, column) for column in self.__slots__}
+
+
+class _TaskRow(_Row):
+    __slots__ = ("id", "title", "description", "completed", "version", "created_at", "updated_at", "change_seq")
+
+
+class _RecordRow(_Row):
+    __slots__ = ("id", "name", "city", "state", "occupation")
+
+
+class _Table:
+    """Rows by id, with sorted id lists for the table and for each value of the indexed columns
+
+    Rows are never modified in place once returned, only replaced, so a list
+    of rows taken earlier stays a consistent snapshot.
+    """
+
+    def __init__(self, row_type: type, indexed: Sequence[str] = ()):
+        self.row_type = row_type
+        self.rows: Dict[int, _Row] = {}
+        self.ids: List[int] = []
+        self.indexes: Dict[str, Dict[Any, List[int]]] = {column: {} for column in indexed}
+        self._next_id = 1
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def insert(self, values: Dict) -> _Row:
+        """Insert a row, numbering it"""
+        row = self.row_type(id=self._next_id, **values)
+        self._next_id += 1
+        self.rows[row.id] = row
+        # Numbered ids only grow, so appending keeps every list sorted
+        self.ids.append(row.id)
+        for column, index in self.indexes.items():
+            index.setdefault(getattr(row, column), []).append(row.id)
+        return row
+
+    def put(self, row: _Row):
+        """Insert a row that already has its id"""
+        self.rows[row.id] = row
+        bisect.insort(self.ids, row.id)
+        for column, index in self.indexes.items():
+            bisect.insort(index.setdefault(getattr(row, column), []), row.id)
+
+    def replace(self, row: _Row):
+        old = self.rows[row.id]
+        for column, index in self.indexes.items():
+            if getattr(old, column) != getattr(row, column):
+                self._unindex(column, getattr(old, column), [row.id])
+                bisect.insort(index.setdefault(getattr(row, column), []), row.id)
+        self.rows[row.id] = row
+
+    def delete(self, row_ids: Iterable[int]) -> List[_Row]:
+        """Delete rows by id, returning the ones that existed"""
+        deleted = [row for row in (self.rows.pop(row_id, None) for row_id in row_ids) if row is not None]
+        if deleted:
+            self.ids = _remove_sorted(self.ids, (row.id for row in deleted))
+            for column in self.indexes:
+                by_value: Dict[Any, List[int]] = {}
+                for row in deleted:
+                    by_value.setdefault(getattr(row, column), []).append(row.id)
+                for value, ids in by_value.items():
+                    self._unindex(column, value, ids)
+        return deleted
+
+    def _unindex(self, column: str, value, ids: List[int]):
+        index = self.indexes[column]
+        remaining = _remove_sorted(index[value], ids)
+        if remaining:
+            index[value] = remaining
+        else:
+            del index[value]
+
+    def scan(self, after_id: Optional[int] = None, **equal) -> Iterator[_Row]:
+        """Rows in id order after after_id whose columns equal the given non-None values
+
+        Walks the shortest matching index list and checks the other
+        conditions row by row.
+        """
+        equal = {column: value for column, value in equal.items() if value is not None}
+        candidates = self.ids
+        for column, value in equal.items():
+            ids = self.indexes[column].get(value, [])
+            if len(ids) < len(candidates):
+                candidates = ids
+        start = 0 if after_id is None else bisect.bisect_right(candidates, after_id)
+        for i in range(start, len(candidates)):
+            row = self.rows[candidates[i]]
+            if all(getattr(row, column) == value for column, value in equal.items()):
+                yield row
+
+
+class MemoryBackend(StorageBackend):
+    """In-process storage matching Database's results, for tests and benchmarks
+
+    Nothing is persisted or shared between processes. Each task write takes
+    the next change sequence number, playing the part of the transaction id
+    in change-feed positions.
+    """
+
+    def __init__(self):
+        self.tasks = _Table(_TaskRow, indexed=("completed",))
+        # Archived tasks keep their ids and never change
+        self.archive = _Table(_TaskRow, indexed=("completed",))
+        self.records = _Table(_RecordRow, indexed=("state", "city", "occupation"))
+        # (change_seq, id) of every task write in order; entries superseded by a later write are skipped
+        self._change_log: List[Tuple[int, int]] = []
+        self._change_seq = 0
+        # id -> (change_seq, deleted_at) of deleted tasks
+        self.tombstones: Dict[int, Tuple[int, datetime]] = {}
+        self._purged_through = 0
+        self.facets: Dict[str, Dict[Optional[str], int]] = {column: {} for column in FACET_COLUMNS}
+        self.completed_tasks = 0
+        self._change_callbacks: List[Callable[[str, int], None]] = []
+        self.tombstone_retention = float(os.getenv("TASK_TOMBSTONE_RETENTION_HOURS", "720")) * 3600
+        self.tombstone_purge_interval = float(os.getenv("TASK_TOMBSTONE_PURGE_INTERVAL", "3600"))
+        self._tombstone_purger: Optional[asyncio.Task] = None
+
+    async def connect(self):
+        if self.tombstone_retention > 0:
+            self._tombstone_purger = asyncio.create_task(self._purge_tombstones_periodically())
+
+    async def disconnect(self):
+        if self._tombstone_purger is not None:
+            self._tombstone_purger.cancel()
+            try:
+                await self._tombstone_purger
+            except asyncio.CancelledError:
+                pass
+            self._tombstone_purger = None
+
+    async def create_tables(self) -> List[str]:
+        return []
+
+    async def schema_is_current(self) -> bool:
+        return True
+
+    def subscribe_changes(self, on_change, on_reset) -> bool:
+        """Every write goes through this process, so none can be missed"""
+        self._change_callbacks.append(on_change)
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "tasks": len(self.tasks),
+            "archived_tasks": len(self.archive),
+            "test_records": len(self.records),
+            "tombstones": len(self.tombstones),
+        }
+
+    def _changed(self, op: str, rows: List[_TaskRow]) -> int:
+        """Stamp rows with the next change sequence number and notify subscribers"""
+        self._change_seq += 1
+        now = _now()
+        for row in sorted(rows, key=lambda row: row.id):
+            self._change_log.append((self._change_seq, row.id))
+            if op == "DELETE":
+                self.tombstones[row.id] = (self._change_seq, now)
+            else:
+                row.change_seq = self._change_seq
+                row.updated_at = now
+        for row in rows:
+            for callback in self._change_callbacks:
+                callback(op, row.id)
+        return self._change_seq
+
+    @staticmethod
+    def _task(row: _TaskRow, columns: Sequence[str] = TASK_COLUMNS) -> Dict:
+        return {column: getattr(row, column) for column in columns}
+
+    def _scan_tasks(
+        self,
+        after_id: Optional[int],
+        completed: Optional[bool],
+        created_after: Optional[datetime],
+        include_archived: bool = False,
+    ) -> Iterator[_TaskRow]:
+        rows = self.tasks.scan(after_id, completed=completed)
+        if include_archived:
+            archived = self.archive.scan(after_id, completed=completed)
+            rows = heapq.merge(rows, archived, key=lambda row: row.id)
+        if created_after is not None:
+            created_after = utc_naive(created_after)
+            rows = (row for row in rows if row.created_at > created_after)
+        return rows
+
+    @timed
+    async def get_all_tasks(
+        self,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        completed: Optional[bool] = None,
+        created_after: Optional[datetime] = None,
+        columns: Sequence[str] = TASK_COLUMNS,
+        include_archived: bool = False,
+    ) -> List[Dict]:
+        """Retrieve tasks ordered by id, optionally filtered, keyset-paginated and narrowed to columns"""
+        _check_columns(columns, TASK_COLUMNS)
+        tasks = []
+        for row in self._scan_tasks(after_id, completed, created_after, include_archived):
+            if limit is not None and len(tasks) >= limit:
+                break
+            tasks.append(self._task(row, columns))
+        return tasks
+
+    async def iter_tasks(
+        self,
+        batch_size: int = 1000,
+        completed: Optional[bool] = None,
+        created_after: Optional[datetime] = None,
+        include_archived: bool = False,
+    ) -> AsyncIterator[List[Dict]]:
+        """Stream tasks ordered by id in fixed-size batches, as of the first batch"""
+        rows = list(self._scan_tasks(None, completed, created_after, include_archived))
+        for start in range(0, len(rows), batch_size):
+            yield [self._task(row, ("id", "title", "description", "completed")) for row in rows[start:start + batch_size]]
+
+    @timed
+    async def get_task(self, task_id: int) -> Optional[Dict]:
+        row = self.tasks.rows.get(task_id)
+        return self._task(row) if row is not None else None
+
+    @timed
+    async def get_archived_task(self, task_id: int) -> Optional[Dict]:
+        row = self.archive.rows.get(task_id)
+        return self._task(row) if row is not None else None
+
+    def _insert_tasks(self, tasks: List[Tuple[str, Optional[str], bool]]) -> List[int]:
+        now = _now()
+        rows = [
+            self.tasks.insert({
+                "title": title, "description": description, "completed": completed, "version": 1,
+                "created_at": now, "updated_at": now, "change_seq": 0,
+            })
+            for title, description, completed in tasks
+        ]
+        self.completed_tasks += sum(1 for row in rows if row.completed)
+        self._changed("INSERT", rows)
+        return [row.id for row in rows]
+
+    @timed
+    async def create_task(self, title: str, description: Optional[str], completed: bool) -> int:
+        return self._insert_tasks([(title, description, completed)])[0]
+
+    @timed
+    async def create_tasks(self, tasks: List[Tuple[str, Optional[str], bool]]) -> List[int]:
+        return self._insert_tasks(tasks) if tasks else []
+
+    def _update_tasks(
+        self, updates: List[Tuple[int, Dict]], expected_version: Optional[int] = None
+    ) -> List[_TaskRow]:
+        """Apply column changes to existing tasks at expected_version, returning the new rows"""
+        rows = []
+        for task_id, changes in updates:
+            row = self.tasks.rows.get(task_id)
+            if row is None or (expected_version is not None and row.version != expected_version):
+                continue
+            self.completed_tasks -= bool(row.completed)
+            row = row.replace(**changes, version=row.version + 1)
+            self.completed_tasks += bool(row.completed)
+            self.tasks.replace(row)
+            rows.append(row)
+        if rows:
+            self._changed("UPDATE", rows)
+        return rows
+
+    @timed
+    async def update_task(
+        self,
+        task_id: int,
+        title: str,
+        description: Optional[str],
+        completed: bool,
+        expected_version: Optional[int] = None,
+    ) -> Optional[int]:
+        changes = {"title": title, "description": description, "completed": completed}
+        rows = self._update_tasks([(task_id, changes)], expected_version)
+        return rows[0].version if rows else None
+
+    @timed
+    async def patch_task(
+        self,
+        task_id: int,
+        changes: Dict,
+        expected_version: Optional[int] = None,
+    ) -> Optional[Dict]:
+        _check_columns(tuple(changes), PATCHABLE_TASK_COLUMNS)
+        rows = self._update_tasks([(task_id, changes)], expected_version)
+        return self._task(rows[0]) if rows else None
+
+    @timed
+    async def update_tasks(self, tasks: List[Tuple[int, str, Optional[str], bool]]) -> List[int]:
+        rows = self._update_tasks([
+            (task_id, {"title": title, "description": description, "completed": completed})
+            for task_id, title, description, completed in tasks
+        ])
+        return [row.id for row in rows]
+
+    def _delete_tasks(self, task_ids: Iterable[int]) -> List[_TaskRow]:
+        rows = self.tasks.delete(task_ids)
+        self.completed_tasks -= sum(1 for row in rows if row.completed)
+        if rows:
+            self._changed("DELETE", rows)
+        return rows
+
+    @timed
+    async def delete_task(self, task_id: int, expected_version: Optional[int] = None) -> bool:
+        row = self.tasks.rows.get(task_id)
+        if row is None or (expected_version is not None and row.version != expected_version):
+            return False
+        return bool(self._delete_tasks([task_id]))
+
+    @timed
+    async def delete_tasks(self, task_ids: List[int]) -> List[int]:
+        return [row.id for row in self._delete_tasks(task_ids)]
+
+    @staticmethod
+    def _write_error(version: Optional[int], expected_version: Optional[int]) -> Optional[str]:
+        """Why a write to a task at version (None when it doesn't exist) fails, if it does"""
+        if version is None:
+            return "not_found"
+        if expected_version is not None and version != expected_version:
+            return "version_conflict"
+        return None
+
+    def _batch_failure(self, operations: List[Dict]) -> Optional[Tuple[int, Dict]]:
+        """Index and result of the first operation that would fail, without writing anything
+
+        Versions are tracked as the earlier operations would leave them.
+        """
+        versions: Dict[int, Optional[int]] = {}
+        next_id = self.tasks._next_id
+        for i, operation in enumerate(operations):
+            if operation["op"] == "create":
+                versions[next_id] = 1
+                next_id += 1
+                continue
+            task_id = operation["id"]
+            if task_id in versions:
+                version = versions[task_id]
+            else:
+                row = self.tasks.rows.get(task_id)
+                version = row.version if row is not None else None
+            error = self._write_error(version, operation.get("expected_version"))
+            if error is None and operation["op"] == "patch":
+                try:
+                    _check_columns(tuple(operation["changes"]), PATCHABLE_TASK_COLUMNS)
+                except ValueError as exc:
+                    return i, {"id": task_id, "task": None, "error": "invalid", "detail": str(exc)}
+            if error is not None:
+                return i, {"id": task_id, "task": None, "error": error}
+            versions[task_id] = None if operation["op"] == "delete" else version + 1
+        return None
+
+    def _run_operation(self, operation: Dict) -> Dict:
+        if operation["op"] == "create":
+            task_id = self._insert_tasks([(operation["title"], operation["description"], operation["completed"])])[0]
+            return {"id": task_id, "task": self._task(self.tasks.rows[task_id]), "error": None}
+        task_id = operation["id"]
+        row = self.tasks.rows.get(task_id)
+        error = self._write_error(row.version if row is not None else None, operation.get("expected_version"))
+        if error is not None:
+            return {"id": task_id, "task": None, "error": error}
+        if operation["op"] == "delete":
+            self._delete_tasks([task_id])
+            return {"id": task_id, "task": None, "error": None}
+        if operation["op"] == "patch":
+            changes = operation["changes"]
+            try:
+                _check_columns(tuple(changes), PATCHABLE_TASK_COLUMNS)
+            except ValueError as exc:
+                return {"id": task_id, "task": None, "error": "invalid", "detail": str(exc)}
+        else:
+            changes = {column: operation[column] for column in PATCHABLE_TASK_COLUMNS}
+        row = self._update_tasks([(task_id, changes)])[0]
+        return {"id": task_id, "task": self._task(row), "error": None}
+
+    @timed
+    async def run_batch(self, operations: List[Dict], atomic: bool = True) -> Tuple[bool, List[Dict]]:
+        """Run task writes in order; nothing here can fail halfway, so atomic batches are checked first"""
+        if atomic:
+            failure = self._batch_failure(operations)
+            if failure is not None:
+                i, result = failure
+                rolled_back = [{"id": operation.get("id"), "task": None, "error": None} for operation in operations[:i]]
+                return False, rolled_back + [result]
+        return True, [self._run_operation(operation) for operation in operations]
+
+    @timed
+    async def archive_tasks(self, older_than: datetime, batch_size: Optional[int] = None) -> int:
+        """Move tasks completed and unchanged since before older_than to the archive, all at once
+
+        There are no row locks to keep short here, so batch_size is ignored.
+        """
+        older_than = utc_naive(older_than)
+        ids = [row.id for row in self.tasks.scan(completed=True) if row.updated_at < older_than]
+        rows = self._delete_tasks(ids)
+        for row in rows:
+            self.archive.put(row)
+        return len(rows)
+
+    @timed
+    async def get_task_stats(self) -> Dict:
+        total = len(self.tasks)
+        return {"total": total, "completed": self.completed_tasks, "open": total - self.completed_tasks}
+
+    @timed
+    async def get_changes(self, after: Tuple[int, int] = (0, 0), limit: int = 100) -> Dict:
+        """Tasks created or updated, and ids deleted, after a change-feed position
+
+        Positions are (change_seq, id) pairs; see Database.get_changes.
+        """
+        after = tuple(after)
+        if after != (0, 0) and self._purged_through and after[0] <= self._purged_through:
+            raise CursorExpiredError(after)
+        changes: List[Dict] = []
+        deleted: List[int] = []
+        position = None
+        has_more = False
+        start = bisect.bisect_right(self._change_log, after)
+        for i in range(start, len(self._change_log)):
+            change_seq, task_id = self._change_log[i]
+            row = self.tasks.rows.get(task_id)
+            if row is not None and row.change_seq == change_seq:
+                entry = self._task(row)
+            elif self.tombstones.get(task_id, (None,))[0] == change_seq:
+                entry = None
+            else:
+                # Superseded by a later write, which has its own entry
+                continue
+            if len(changes) + len(deleted) == limit:
+                has_more = True
+                break
+            if entry is None:
+                deleted.append(task_id)
+            else:
+                changes.append(entry)
+            position = (change_seq, task_id)
+        if not has_more:
+            # Nothing is ever in flight here, so everything up to the latest write has been returned
+            position = max(after, (self._change_seq + 1, 0))
+        return {"changes": changes, "deleted": deleted, "position": position, "has_more": has_more}
+
+    @timed
+    async def purge_tombstones(self, older_than: datetime) -> int:
+        """Drop tombstones deleted before older_than, expiring change-feed positions they cover"""
+        older_than = utc_naive(older_than)
+        purged = [
+            (task_id, change_seq) for task_id, (change_seq, deleted_at) in self.tombstones.items()
+            if deleted_at < older_than
+        ]
+        for task_id, change_seq in purged:
+            del self.tombstones[task_id]
+            self._purged_through = max(self._purged_through, change_seq)
+        if purged:
+            # Also drops log entries for writes superseded since
+            self._change_log = [
+                (change_seq, task_id) for change_seq, task_id in self._change_log
+                if getattr(self.tasks.rows.get(task_id), "change_seq", None) == change_seq
+                or self.tombstones.get(task_id, (None,))[0] == change_seq
+            ]
+        return len(purged)
+
+    # Test table methods
+    def _count_facets(self, row: _RecordRow, delta: int):
+        for column in FACET_COLUMNS:
+            counts = self.facets[column]
+            value = getattr(row, column)
+            counts[value] = counts.get(value, 0) + delta
+            if not counts[value]:
+                del counts[value]
+
+    @timed
+    async def get_all_test_records(
+        self,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        state: Optional[str] = None,
+        city: Optional[str] = None,
+        occupation: Optional[str] = None,
+    ) -> List[Dict]:
+        records = []
+        for row in self.records.scan(after_id, state=state, city=city, occupation=occupation):
+            if limit is not None and len(records) >= limit:
+                break
+            records.append(row.as_dict())
+        return records
+
+    @timed
+    async def get_test_facets(self) -> Dict[str, List[Dict]]:
+        """Record counts by state and by occupation, most common first, nulls after other values on ties"""
+        return {
+            column: [
+                {"value": value, "count": count}
+                for value, count in sorted(counts.items(), key=lambda item: (-item[1], item[0] is None, item[0] or ""))
+            ]
+            for column, counts in self.facets.items()
+        }
+
+    @timed
+    async def get_test_record(self, record_id: int) -> Optional[Dict]:
+        row = self.records.rows.get(record_id)
+        return row.as_dict() if row is not None else None
+
+    @timed
+    async def create_test_record(self, name: str, city: str, state: str, occupation: str) -> int:
+        row = self.records.insert({"name": name, "city": city, "state": state, "occupation": occupation})
+        self._count_facets(row, 1)
+        return row.id
+
+    @timed
+    async def update_test_record(self, record_id: int, name: str, city: str, state: str, occupation: str) -> bool:
+        old = self.records.rows.get(record_id)
+        if old is None:
+            return False
+        row = _RecordRow(id=record_id, name=name, city=city, state=state, occupation=occupation)
+        self.records.replace(row)
+        self._count_facets(old, -1)
+        self._count_facets(row, 1)
+        return True
+
+    @timed
+    async def delete_test_record(self, record_id: int) -> bool:
+        rows = self.records.delete([record_id])
+        for row in rows:
+            self._count_facets(row, -1)
+        return bool(rows)
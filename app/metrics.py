@@ -0,0 +1,252 @@
+"""Prometheus metrics in the text exposition format
+
+A minimal, dependency-free take on prometheus_client. Metrics are only
+updated from the event loop thread, so plain attribute updates are safe and
+no request ever waits on a lock.
+"""
+import abc
+import bisect
+import functools
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List["_Metric"] = []
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class _Metric(abc.ABC):
+    kind = ""
+    # Appended to the name in the exposition, where HELP and TYPE must name what the samples do
+    suffix = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        _registry.append(self)
+
+    def labels(self, *values: str):
+        """Return the child for these label values, creating it on first use"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self):
+        ...
+
+    @abc.abstractmethod
+    def _samples(self) -> Iterable[str]:
+        ...
+
+    def render(self) -> str:
+        family = f"{self.name}{self.suffix}"
+        lines = [f"# HELP {family} {self.documentation}", f"# TYPE {family} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+    suffix = "_total"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in self._children.items():
+            yield f"{self.name}{self.suffix}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def _samples(self):
+        for values, child in self._children.items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class GaugeCallback(_Metric):
+    """Gauge whose samples are read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Dict[Tuple[str, ...], float]],
+        labelnames: Sequence[str] = (),
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _new_child(self):
+        raise TypeError(f"{self.name} is read from its callback and has no children to set")
+
+    def _samples(self):
+        for values, value in self.callback().items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self):
+        for values, child in self._children.items():
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                le = 'le="' + _format_value(upper_bound) + '"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+def render() -> str:
+    """Render every registered metric"""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# HTTP layer (MetricsMiddleware)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ("method", "route", "status"),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served, by route template", ("method", "route")
+)
+
+# Admission control (AdmissionControlMiddleware)
+ADMISSION_IN_FLIGHT = Gauge(
+    "admission_in_flight", "Admitted requests currently running, by endpoint class", ("class",)
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "admission_queue_depth", "Requests waiting for admission, by endpoint class", ("class",)
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected", "Requests shed with 503, by endpoint class", ("class",)
+)
+
+# Request deadlines (DeadlineMiddleware and Database)
+DEADLINE_EXCEEDED = Counter(
+    "request_deadline_exceeded", "Requests failed with 504, by what they were waiting for", ("stage",)
+)
+
+# Task change stream (TaskEventBroker)
+TASK_STREAM_SUBSCRIBERS = Gauge("task_stream_subscribers", "Open GET /tasks/stream connections")
+TASK_STREAM_EVICTIONS = Counter("task_stream_evictions", "Stream subscribers dropped for falling behind")
+
+# Database layer (Database)
+DB_POOL_ACQUIRE_WAIT = Histogram(
+    "db_pool_acquire_wait_seconds", "Time spent waiting for a pooled connection", ("pool",),
+)
+DB_POOL_ACQUIRE_TIMEOUTS = Counter(
+    "db_pool_acquire_timeouts", "Pool acquires that gave up waiting for a connection", ("pool",)
+)
+DB_QUERY_DURATION = Histogram(
+    "db_method_duration_seconds", "Latency of Database methods, including pool waits", ("method",),
+)
+DB_QUERY_ERRORS = Counter(
+    "db_method_errors", "Database method calls that raised", ("method",)
+)
+DB_POOL_CONNECTIONS = GaugeCallback(
+    "db_pool_connections", "Open and idle connections per pool", lambda: {}, ("pool", "state"),
+)
+
+
+def timed(method):
+    """Record a Database coroutine method's latency and errors, labelled with its name"""
+    duration = DB_QUERY_DURATION.labels(method.__name__)
+    errors = DB_QUERY_ERRORS.labels(method.__name__)
+
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            duration.observe(time.perf_counter() - started)
+
+    return wrapper
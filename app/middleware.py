@@ -0,0 +1,213 @@
+import time
+from typing import Dict, Iterable, Optional
+from starlette.responses import JSONResponse
+from starlette.routing import Match
+from admission import AdmissionController, Overloaded
+from deadline import current_deadline
+from metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT
+from replicas import current_client
+from timing import RequestTiming, current_timing
+
+
+class ClientIdentityMiddleware:
+    """Identifies the caller for read-your-writes stickiness
+
+    Uses the X-Client-Id header when present, otherwise the peer address.
+    Behind a proxy every peer address is the proxy's, so with trust_forwarded
+    the first X-Forwarded-For hop is used instead; only enable it when a proxy
+    that sets the header is the only way in, since clients can forge it.
+    """
+
+    def __init__(self, app, trust_forwarded: bool = False):
+        self.app = app
+        self.trust_forwarded = trust_forwarded
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        client = forwarded = None
+        for name, value in scope["headers"]:
+            if name == b"x-client-id":
+                client = value.decode("latin-1")
+                break
+            if name == b"x-forwarded-for" and forwarded is None:
+                forwarded = value.decode("latin-1").split(",")[0].strip() or None
+        if client is None and self.trust_forwarded:
+            client = forwarded
+        if client is None and scope.get("client"):
+            client = scope["client"][0]
+        token = current_client.set(client)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_client.reset(token)
+
+
+class MetricsMiddleware:
+    """Records request latency and the number of requests in flight per route template
+
+    The route is matched against the app's routes before the request runs,
+    the way the router will match it, so in-flight requests can be labelled
+    too. Path parameters never become label values; unmatched paths share
+    one label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = self._route(scope)
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method, route)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_DURATION.labels(method, route, str(status)).observe(
+                time.perf_counter() - started
+            )
+
+    @staticmethod
+    def _route(scope) -> str:
+        for route in scope["app"].routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return route.path
+        return "unmatched"
+
+
+class ServerTimingMiddleware:
+    """Reports the request's pool wait, database and remaining time in a Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timing = RequestTiming()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = current_timing.set(timing)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current_timing.reset(token)
+
+
+class AdmissionControlMiddleware:
+    """Sheds load with 503 once the read or write admission queue is full
+
+    GET, HEAD and OPTIONS requests are reads, everything else a write.
+    Paths in path_controllers are admitted by their own controller instead,
+    so long-lived requests there can't use up the read slots. Requests to
+    exempt paths (health checks, metrics) are always admitted.
+    """
+
+    READ_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+    def __init__(
+        self,
+        app,
+        read: AdmissionController,
+        write: AdmissionController,
+        retry_after: int = 1,
+        exempt_paths: Iterable[str] = (),
+        path_controllers: Optional[Dict[str, AdmissionController]] = None,
+    ):
+        self.app = app
+        self.read = read
+        self.write = write
+        self.retry_after = retry_after
+        self.exempt_paths = frozenset(exempt_paths)
+        self.path_controllers = dict(path_controllers or {})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        controller = self.path_controllers.get(scope["path"])
+        if controller is None:
+            controller = self.read if scope["method"] in self.READ_METHODS else self.write
+        try:
+            await controller.acquire()
+        except Overloaded:
+            response = JSONResponse(
+                {"detail": "Service overloaded, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release()
+
+
+class DeadlineMiddleware:
+    """Gives each request a deadline that database waits and statements stop at
+
+    The budget, in seconds, is the X-Request-Timeout header capped at
+    max_timeout when the client sends one, otherwise the path's entry in
+    route_timeouts, otherwise default. None means no deadline.
+    """
+
+    def __init__(
+        self,
+        app,
+        default: Optional[float],
+        max_timeout: Optional[float] = None,
+        route_timeouts: Optional[Dict[str, Optional[float]]] = None,
+    ):
+        self.app = app
+        self.default = default
+        self.max_timeout = max_timeout
+        self.route_timeouts = dict(route_timeouts or {})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timeout = self._timeout(scope)
+        if timeout is None:
+            await self.app(scope, receive, send)
+            return
+        token = current_deadline.set(time.monotonic() + timeout)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_deadline.reset(token)
+
+    def _timeout(self, scope) -> Optional[float]:
+        for name, value in scope["headers"]:
+            if name == b"x-request-timeout":
+                try:
+                    requested = float(value)
+                except ValueError:
+                    break
+                if requested > 0:
+                    return requested if self.max_timeout is None else min(requested, self.max_timeout)
+                break
+        return self.route_timeouts.get(scope["path"], self.default)
@@ -0,0 +1,20 @@
+-- Tables previously created by Database.create_tables on every boot.
+-- IF NOT EXISTS keeps this a no-op on databases bootstrapped that way.
+CREATE TABLE IF NOT EXISTS tasks (
+    id SERIAL PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    description TEXT,
+    completed BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS test (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100),
+    city VARCHAR(100),
+    state VARCHAR(50),
+    occupation VARCHAR(100)
+);
+
+-- Bumped by every update; backs ETags and If-Match
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
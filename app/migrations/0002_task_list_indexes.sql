@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- Indexes backing keyset pagination and filters on GET /tasks
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_completed_id ON tasks (completed, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_created_at_id ON tasks (created_at, id);
@@ -0,0 +1,16 @@
+-- Publish {"op": ..., "id": ...} on the tasks_changed channel for every row change,
+-- consumed by notify.ChangeListener for cross-process cache invalidation
+CREATE OR REPLACE FUNCTION notify_task_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('tasks_changed', json_build_object('op', TG_OP, 'id', OLD.id)::text);
+        RETURN OLD;
+    END IF;
+    PERFORM pg_notify('tasks_changed', json_build_object('op', TG_OP, 'id', NEW.id)::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER tasks_notify
+    AFTER INSERT OR UPDATE OR DELETE ON tasks
+    FOR EACH ROW EXECUTE FUNCTION notify_task_change();
@@ -0,0 +1,53 @@
+-- Change feed behind GET /tasks/changes.
+-- Every insert and update stamps the row with the writing transaction's id;
+-- deletes leave a tombstone stamped the same way. Readers only return
+-- changes from transactions older than their snapshot's xmin, so a change
+-- can never commit behind a cursor that was already handed out.
+-- Both defaults are constant, so adding the columns doesn't rewrite the table;
+-- existing rows sort first in the feed.
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE tasks ADD COLUMN IF NOT EXISTS change_xid BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION stamp_task_change() RETURNS trigger AS $$
+BEGIN
+    NEW.change_xid := pg_current_xact_id()::text::bigint;
+    IF TG_OP = 'UPDATE' THEN
+        NEW.updated_at := CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER tasks_stamp_change
+    BEFORE INSERT OR UPDATE ON tasks
+    FOR EACH ROW EXECUTE FUNCTION stamp_task_change();
+
+CREATE TABLE IF NOT EXISTS task_tombstones (
+    id INTEGER PRIMARY KEY,
+    change_xid BIGINT NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_task_tombstones_change_xid ON task_tombstones (change_xid, id);
+CREATE INDEX IF NOT EXISTS idx_task_tombstones_deleted_at ON task_tombstones (deleted_at);
+
+-- Highest change_xid among purged tombstones; cursors below it are expired
+CREATE TABLE IF NOT EXISTS task_tombstone_horizon (
+    singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+    purged_through BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO task_tombstone_horizon DEFAULT VALUES ON CONFLICT DO NOTHING;
+
+-- One INSERT per DELETE statement, however many rows it removed
+CREATE OR REPLACE FUNCTION record_task_tombstones() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO task_tombstones (id, change_xid)
+    SELECT id, pg_current_xact_id()::text::bigint FROM deleted_tasks
+    ON CONFLICT (id) DO UPDATE SET change_xid = EXCLUDED.change_xid, deleted_at = CURRENT_TIMESTAMP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER tasks_record_tombstones
+    AFTER DELETE ON tasks
+    REFERENCING OLD TABLE AS deleted_tasks
+    FOR EACH STATEMENT EXECUTE FUNCTION record_task_tombstones();
@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+-- Keyset scans of the change feed
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_tasks_change_xid_id ON tasks (change_xid, id);
@@ -0,0 +1,66 @@
+-- Per-value record counts behind GET /records/facets, kept current by
+-- statement-level triggers so reads never GROUP BY the whole test table.
+-- Counts can reach zero; readers skip those rows.
+CREATE TABLE IF NOT EXISTS test_facets (
+    facet TEXT NOT NULL,
+    value TEXT,
+    count BIGINT NOT NULL
+);
+-- Missing values are counted too, as a NULL value
+CREATE UNIQUE INDEX IF NOT EXISTS idx_test_facets_facet_value
+    ON test_facets (facet, value) NULLS NOT DISTINCT;
+
+-- One upsert per distinct value touched by the statement, taken in a fixed
+-- order so concurrent writers can't deadlock on the counter rows
+CREATE OR REPLACE FUNCTION update_test_facets() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO test_facets AS f (facet, value, count)
+        SELECT v.facet, v.value, COUNT(*)
+        FROM new_rows, LATERAL (VALUES ('state', new_rows.state), ('occupation', new_rows.occupation)) AS v(facet, value)
+        GROUP BY v.facet, v.value
+        ORDER BY v.facet, v.value
+        ON CONFLICT (facet, value) DO UPDATE SET count = f.count + EXCLUDED.count;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO test_facets AS f (facet, value, count)
+        SELECT v.facet, v.value, -COUNT(*)
+        FROM old_rows, LATERAL (VALUES ('state', old_rows.state), ('occupation', old_rows.occupation)) AS v(facet, value)
+        GROUP BY v.facet, v.value
+        ORDER BY v.facet, v.value
+        ON CONFLICT (facet, value) DO UPDATE SET count = f.count + EXCLUDED.count;
+    ELSE
+        INSERT INTO test_facets AS f (facet, value, count)
+        SELECT facet, value, SUM(delta)
+        FROM (
+            SELECT v.facet, v.value, 1 AS delta
+            FROM new_rows, LATERAL (VALUES ('state', new_rows.state), ('occupation', new_rows.occupation)) AS v(facet, value)
+            UNION ALL
+            SELECT v.facet, v.value, -1
+            FROM old_rows, LATERAL (VALUES ('state', old_rows.state), ('occupation', old_rows.occupation)) AS v(facet, value)
+        ) AS changes
+        GROUP BY facet, value
+        HAVING SUM(delta) <> 0
+        ORDER BY facet, value
+        ON CONFLICT (facet, value) DO UPDATE SET count = f.count + EXCLUDED.count;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER test_facets_insert
+    AFTER INSERT ON test REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_test_facets();
+CREATE OR REPLACE TRIGGER test_facets_update
+    AFTER UPDATE ON test REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_test_facets();
+CREATE OR REPLACE TRIGGER test_facets_delete
+    AFTER DELETE ON test REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_test_facets();
+
+-- Backfill after the triggers exist: creating them locked out writers until
+-- this transaction commits, so no row is missed or counted twice
+DELETE FROM test_facets;
+INSERT INTO test_facets (facet, value, count)
+SELECT 'state', state, COUNT(*) FROM test GROUP BY state
+UNION ALL
+SELECT 'occupation', occupation, COUNT(*) FROM test GROUP BY occupation;
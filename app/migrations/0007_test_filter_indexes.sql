@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Equality filters plus keyset pagination on GET /records
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_test_state_id ON test (state, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_test_city_id ON test (city, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_test_occupation_id ON test (occupation, id);
@@ -0,0 +1,55 @@
+-- Task totals behind GET /tasks/stats, kept current by statement-level
+-- triggers so reads never COUNT(*) the tasks table. Each statement adds its
+-- deltas to one of 16 shard rows, picked by backend pid, so concurrent
+-- writers on different connections rarely wait on the same row lock.
+-- Readers sum the shards.
+CREATE TABLE IF NOT EXISTS task_counters (
+    shard SMALLINT PRIMARY KEY,
+    total BIGINT NOT NULL,
+    completed BIGINT NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION update_task_counters() RETURNS trigger AS $$
+DECLARE
+    total_delta BIGINT := 0;
+    completed_delta BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        SELECT COUNT(*), COUNT(*) FILTER (WHERE completed)
+        INTO total_delta, completed_delta
+        FROM new_rows;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        SELECT total_delta - COUNT(*), completed_delta - COUNT(*) FILTER (WHERE completed)
+        INTO total_delta, completed_delta
+        FROM old_rows;
+    END IF;
+    -- Most updates don't change completed, and then there is nothing to write
+    IF total_delta <> 0 OR completed_delta <> 0 THEN
+        UPDATE task_counters
+        SET total = total + total_delta, completed = completed + completed_delta
+        WHERE shard = pg_backend_pid() % 16;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER task_counters_insert
+    AFTER INSERT ON tasks REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_task_counters();
+CREATE OR REPLACE TRIGGER task_counters_update
+    AFTER UPDATE ON tasks REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_task_counters();
+CREATE OR REPLACE TRIGGER task_counters_delete
+    AFTER DELETE ON tasks REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_task_counters();
+
+-- Backfill after the triggers exist: creating them locked out writers until
+-- this transaction commits, so no row is missed or counted twice
+DELETE FROM task_counters;
+INSERT INTO task_counters (shard, total, completed)
+SELECT shard, 0, 0 FROM generate_series(0, 15) AS shard;
+UPDATE task_counters
+SET total = (SELECT COUNT(*) FROM tasks),
+    completed = (SELECT COUNT(*) FROM tasks WHERE completed)
+WHERE shard = 0;
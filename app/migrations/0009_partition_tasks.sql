@@ -0,0 +1,120 @@
+-- Range-partition tasks by created_at, one partition per calendar month.
+-- The existing table becomes the partition for everything before the first
+-- month boundary after its newest row, so no row is copied: attaching it
+-- only scans it to check the bound, and the new primary key index is built
+-- once. Both happen under the lock taken by the rename, so on a large table
+-- run this in a quiet window.
+-- Partitions for upcoming months are created by create_task_partitions(),
+-- called here and periodically by Database. The default partition only
+-- catches rows that arrive before their month's partition exists.
+
+-- Partition keys can't be NULL
+UPDATE tasks SET created_at = updated_at WHERE created_at IS NULL;
+
+-- Triggers on the parent are cloned onto partitions, so the old copies must go
+DROP TRIGGER IF EXISTS tasks_notify ON tasks;
+DROP TRIGGER IF EXISTS tasks_stamp_change ON tasks;
+DROP TRIGGER IF EXISTS tasks_record_tombstones ON tasks;
+DROP TRIGGER IF EXISTS task_counters_insert ON tasks;
+DROP TRIGGER IF EXISTS task_counters_update ON tasks;
+DROP TRIGGER IF EXISTS task_counters_delete ON tasks;
+
+-- A partitioned table's primary key must include the partition key
+ALTER TABLE tasks DROP CONSTRAINT tasks_pkey;
+ALTER TABLE tasks ALTER COLUMN created_at SET NOT NULL;
+ALTER TABLE tasks RENAME TO tasks_legacy;
+ALTER INDEX idx_tasks_completed_id RENAME TO idx_tasks_legacy_completed_id;
+ALTER INDEX idx_tasks_created_at_id RENAME TO idx_tasks_legacy_created_at_id;
+ALTER INDEX idx_tasks_change_xid_id RENAME TO idx_tasks_legacy_change_xid_id;
+
+CREATE TABLE tasks (
+    id INTEGER NOT NULL DEFAULT nextval('tasks_id_seq'),
+    title VARCHAR(255) NOT NULL,
+    description TEXT,
+    completed BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    version INTEGER NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    change_xid BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+ALTER SEQUENCE tasks_id_seq OWNED BY tasks.id;
+
+DO $$
+DECLARE
+    boundary TIMESTAMP := date_trunc(
+        'month', GREATEST(LOCALTIMESTAMP, (SELECT MAX(created_at) FROM tasks_legacy))
+    ) + INTERVAL '1 month';
+BEGIN
+    EXECUTE format('ALTER TABLE tasks ATTACH PARTITION tasks_legacy FOR VALUES FROM (MINVALUE) TO (%L)', boundary);
+END
+$$;
+CREATE TABLE tasks_default PARTITION OF tasks DEFAULT;
+
+-- Created on the parent, these adopt the legacy partition's matching indexes
+CREATE INDEX idx_tasks_completed_id ON tasks (completed, id);
+CREATE INDEX idx_tasks_created_at_id ON tasks (created_at, id);
+CREATE INDEX idx_tasks_change_xid_id ON tasks (change_xid, id);
+-- Archival candidates: completed tasks by last change
+CREATE INDEX idx_tasks_archivable ON tasks (updated_at) WHERE completed;
+
+CREATE TRIGGER tasks_notify
+    AFTER INSERT OR UPDATE OR DELETE ON tasks
+    FOR EACH ROW EXECUTE FUNCTION notify_task_change();
+CREATE TRIGGER tasks_stamp_change
+    BEFORE INSERT OR UPDATE ON tasks
+    FOR EACH ROW EXECUTE FUNCTION stamp_task_change();
+CREATE TRIGGER tasks_record_tombstones
+    AFTER DELETE ON tasks REFERENCING OLD TABLE AS deleted_tasks
+    FOR EACH STATEMENT EXECUTE FUNCTION record_task_tombstones();
+CREATE TRIGGER task_counters_insert
+    AFTER INSERT ON tasks REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_task_counters();
+CREATE TRIGGER task_counters_update
+    AFTER UPDATE ON tasks REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_task_counters();
+CREATE TRIGGER task_counters_delete
+    AFTER DELETE ON tasks REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION update_task_counters();
+
+-- Creates the missing monthly partitions from the last one through
+-- months_ahead months past the current one, returning how many it created.
+-- Partitions are contiguous, so it continues from the highest upper bound.
+-- Does nothing, and takes no lock, when they already exist.
+CREATE OR REPLACE FUNCTION create_task_partitions(months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    next_start TIMESTAMP;
+    created INTEGER := 0;
+BEGIN
+    SELECT MAX((regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \(''([^'']+)''\)'))[1]::timestamp)
+    INTO next_start
+    FROM pg_inherits AS i JOIN pg_class AS c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'tasks'::regclass;
+    WHILE next_start < date_trunc('month', LOCALTIMESTAMP) + make_interval(months => months_ahead + 1) LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF tasks FOR VALUES FROM (%L) TO (%L)',
+            'tasks_' || to_char(next_start, 'YYYY_MM'), next_start, next_start + INTERVAL '1 month'
+        );
+        next_start := next_start + INTERVAL '1 month';
+        created := created + 1;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_task_partitions(3);
+
+-- Completed tasks moved out of the hot table by Database.archive_tasks.
+-- Read only through include_archived; never updated.
+CREATE TABLE IF NOT EXISTS tasks_archive (
+    id INTEGER PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    description TEXT,
+    completed BOOLEAN,
+    created_at TIMESTAMP NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_archive_completed_id ON tasks_archive (completed, id);
+CREATE INDEX IF NOT EXISTS idx_tasks_archive_created_at_id ON tasks_archive (created_at, id);
@@ -0,0 +1,54 @@
+-- create_task_partitions() from 0009 failed in two ways:
+-- * A partition another process created first made it error out, so it
+--   now skips partitions that already exist.
+-- * When maintenance fell behind, rows for a month landed in tasks_default,
+--   and Postgres then refuses to create that month's partition, every run.
+--   Those rows are now moved into the new partition.
+-- Moving them detaches the default partition, builds the month as a plain
+-- table and attaches both. No row is inserted or deleted through tasks, so
+-- no trigger sees the move: the change feed, stream, counters and
+-- updated_at are untouched. Detaching locks tasks exclusively until the
+-- calling transaction ends, so this only happens when there are stragglers.
+-- Database runs the function under an advisory lock, one process at a time.
+CREATE OR REPLACE FUNCTION create_task_partitions(months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    next_start TIMESTAMP;
+    next_end TIMESTAMP;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    SELECT MAX((regexp_match(pg_get_expr(c.relpartbound, c.oid), 'TO \(''([^'']+)''\)'))[1]::timestamp)
+    INTO next_start
+    FROM pg_inherits AS i JOIN pg_class AS c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'tasks'::regclass;
+    WHILE next_start < date_trunc('month', LOCALTIMESTAMP) + make_interval(months => months_ahead + 1) LOOP
+        next_end := next_start + INTERVAL '1 month';
+        partition_name := 'tasks_' || to_char(next_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            IF EXISTS (SELECT 1 FROM tasks_default WHERE created_at >= next_start AND created_at < next_end) THEN
+                ALTER TABLE tasks DETACH PARTITION tasks_default;
+                EXECUTE format('CREATE TABLE %I (LIKE tasks INCLUDING DEFAULTS)', partition_name);
+                EXECUTE format(
+                    'WITH moved AS ('
+                    '    DELETE FROM tasks_default WHERE created_at >= %L AND created_at < %L RETURNING *'
+                    ') INSERT INTO %I SELECT * FROM moved',
+                    next_start, next_end, partition_name
+                );
+                EXECUTE format(
+                    'ALTER TABLE tasks ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, next_start, next_end
+                );
+                ALTER TABLE tasks ATTACH PARTITION tasks_default DEFAULT;
+            ELSE
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF tasks FOR VALUES FROM (%L) TO (%L)',
+                    partition_name, next_start, next_end
+                );
+            END IF;
+            created := created + 1;
+        END IF;
+        next_start := next_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
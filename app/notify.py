@@ -0,0 +1,127 @@
+import asyncio
+import json
+import logging
+import asyncpg
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Published by the tasks_notify trigger (migrations/0003_task_change_notify.sql)
+TASKS_CHANNEL = "tasks_changed"
+
+
+class ChangeListener:
+    """Keeps one dedicated LISTEN connection per process and fans task changes out to callbacks
+
+    Change callbacks receive (op, task_id). Reset callbacks run whenever
+    notifications may have been missed (connect, disconnect, bad payload) so
+    subscribers can flush everything they derived from the database.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        channel: str = TASKS_CHANNEL,
+        reconnect_delay: float = 1.0,
+        max_reconnect_delay: float = 30.0,
+        keepalive_interval: float = 30.0,
+    ):
+        self.dsn = dsn
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.keepalive_interval = keepalive_interval
+        self._change_callbacks: List[Callable[[str, int], None]] = []
+        self._reset_callbacks: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._first_attempt = asyncio.Event()
+        self.connected = False
+        self.notifications = 0
+        self.resets = 0
+        self.reconnects = 0
+
+    def add_change_callback(self, callback: Callable[[str, int], None]):
+        self._change_callbacks.append(callback)
+
+    def add_reset_callback(self, callback: Callable[[], None]):
+        self._reset_callbacks.append(callback)
+
+    async def start(self):
+        """Start listening in the background, returning once the first connection attempt is over"""
+        if self._task is None:
+            self._first_attempt = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        await self._first_attempt.wait()
+
+    async def stop(self):
+        """Stop listening and close the dedicated connection"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            "connected": self.connected,
+            "notifications": self.notifications,
+            "resets": self.resets,
+            "reconnects": self.reconnects,
+        }
+
+    async def _run(self):
+        delay = self.reconnect_delay
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(self.dsn)
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _: lost.set())
+                await conn.add_listener(self.channel, self._on_notification)
+                self.connected = True
+                # Changes made while we weren't listening were never delivered
+                self._reset()
+                self._first_attempt.set()
+                delay = self.reconnect_delay
+                await self._watch(conn, lost)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("Change listener connection failed: %s", exc)
+                self._first_attempt.set()
+            finally:
+                if self.connected:
+                    self.connected = False
+                    self._reset()
+                if conn is not None and not conn.is_closed():
+                    conn.terminate()
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def _watch(self, conn: asyncpg.Connection, lost: asyncio.Event):
+        """Return once the connection is lost, probing it so half-open sockets are noticed"""
+        while not lost.is_set():
+            try:
+                await asyncio.wait_for(lost.wait(), timeout=self.keepalive_interval)
+            except asyncio.TimeoutError:
+                await conn.execute("SELECT 1", timeout=self.keepalive_interval)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        self.notifications += 1
+        try:
+            change = json.loads(payload)
+            op, task_id = change["op"], int(change["id"])
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed change notification: %r", payload)
+            self._reset()
+            return
+        for callback in self._change_callbacks:
+            callback(op, task_id)
+
+    def _reset(self):
+        self.resets += 1
+        for callback in self._reset_callbacks:
+            callback()
@@ -0,0 +1,156 @@
+import asyncio
+import itertools
+import logging
+import time
+import asyncpg
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Identifies the caller of the current request for read-your-writes stickiness
+current_client: ContextVar[Optional[str]] = ContextVar("current_client", default=None)
+
+# Zero while the replica has replayed everything it received, otherwise time since the last replayed commit
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.pool: Optional[asyncpg.Pool] = None
+        self.lag: Optional[float] = None
+        self.healthy = False
+        self.reads = 0
+
+
+class ReplicaRouter:
+    """Load-balances reads across replica pools and keeps recent writers on the primary
+
+    A replica leaves the rotation while its measured lag exceeds max_lag or
+    its lag check fails. Clients that wrote within sticky_window seconds, and
+    tasks changed within that window, are read from the primary.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        max_lag: float = 5.0,
+        check_interval: float = 1.0,
+        sticky_window: float = 5.0,
+        max_sticky_keys: int = 100000,
+    ):
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky_window = sticky_window
+        self.max_sticky_keys = max_sticky_keys
+        self._rotation = itertools.count()
+        self._recent_writes: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._monitor: Optional[asyncio.Task] = None
+        self._pool_kwargs: Dict = {}
+        self.primary_reads = 0
+        self.sticky_reads = 0
+
+    async def connect(self, **pool_kwargs):
+        """Open a pool per replica and start monitoring lag"""
+        self._pool_kwargs = pool_kwargs
+        await self._check_lag()
+        self._monitor = asyncio.create_task(self._monitor_lag())
+
+    async def close(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+        for replica in self.replicas:
+            if replica.pool is not None:
+                await replica.pool.close()
+                replica.pool = None
+
+    def record_write(self, *keys: Hashable):
+        """Pin the current client, and any given keys, to the primary for the sticky window"""
+        expires_at = time.monotonic() + self.sticky_window
+        for key in _with_client(keys):
+            self._recent_writes[key] = expires_at
+            self._recent_writes.move_to_end(key)
+        # Entries expire in insertion order, so pruning only ever looks at the front
+        now = time.monotonic()
+        while self._recent_writes:
+            key, key_expires_at = next(iter(self._recent_writes.items()))
+            if key_expires_at > now and len(self._recent_writes) <= self.max_sticky_keys:
+                break
+            del self._recent_writes[key]
+
+    def read_pool(self, *keys: Hashable) -> Optional[asyncpg.Pool]:
+        """Pick a healthy replica pool, or None when the read must go to the primary"""
+        now = time.monotonic()
+        for key in _with_client(keys):
+            expires_at = self._recent_writes.get(key)
+            if expires_at is not None and expires_at > now:
+                self.sticky_reads += 1
+                return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            self.primary_reads += 1
+            return None
+        replica = healthy[next(self._rotation) % len(healthy)]
+        replica.reads += 1
+        return replica.pool
+
+    def stats(self) -> Dict:
+        return {
+            "replicas": [
+                {"url": _redact(replica.url), "healthy": replica.healthy, "lag": replica.lag, "reads": replica.reads}
+                for replica in self.replicas
+            ],
+            "primary_reads": self.primary_reads,
+            "sticky_reads": self.sticky_reads,
+        }
+
+    async def _monitor_lag(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self._check_lag()
+
+    async def _check_lag(self):
+        for replica in self.replicas:
+            try:
+                if replica.pool is None:
+                    # Unreachable replicas are retried on every check instead of stopping the service
+                    replica.pool = await asyncio.wait_for(
+                        asyncpg.create_pool(replica.url, **self._pool_kwargs), timeout=10
+                    )
+                replica.lag = float(await replica.pool.fetchval(REPLICA_LAG_QUERY, timeout=self.check_interval))
+            except Exception as exc:
+                logger.warning("Replica lag check failed for %s: %s", _redact(replica.url), exc)
+                replica.lag = None
+            healthy = replica.lag is not None and replica.lag <= self.max_lag
+            if healthy != replica.healthy:
+                logger.info("Replica %s %s rotation (lag %s)", _redact(replica.url),
+                            "joined" if healthy else "left", replica.lag)
+            replica.healthy = healthy
+
+
+def _with_client(keys: tuple) -> tuple:
+    """Add the current client's sticky key, if the request identified one"""
+    client = current_client.get()
+    return keys + (("client", client),) if client is not None else keys
+
+
+def _redact(url: str) -> str:
+    """Hide the password in a connection URL"""
+    scheme, sep, rest = url.partition("://")
+    credentials, at, host = rest.rpartition("@")
+    if not at:
+        return url
+    return f"{scheme}{sep}{credentials.split(':')[0]}:***@{host}"
@@ -0,0 +1,90 @@
+import asyncio
+import contextvars
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from deadline import DeadlineExceeded, current_deadline, within_deadline
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """One shared call, run outside every request's context under the latest deadline among its waiters"""
+
+    __slots__ = ("context", "deadline", "task", "waiters")
+
+    def __init__(self, fn: Callable[[], Awaitable], deadline: Optional[float]):
+        self.context = contextvars.Context()
+        self.deadline = deadline
+        self.waiters = 0
+        self.task = self.context.run(self._start, fn)
+
+    def _start(self, fn: Callable[[], Awaitable]) -> asyncio.Task:
+        current_deadline.set(self.deadline)
+        return asyncio.ensure_future(fn())
+
+    def extend(self, deadline: Optional[float]):
+        """Let the stages the call hasn't reached yet run until deadline"""
+        if self.deadline is None or (deadline is not None and deadline <= self.deadline):
+            return
+        self.deadline = deadline
+        # The task only enters its context while it runs, which it isn't while we are
+        self.context.run(current_deadline.set, deadline)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one in-flight call
+
+    Every caller awaiting a key gets the same result object (or exception),
+    so results must be treated as read-only. Each caller stops waiting at
+    its own deadline; the shared call runs under the latest of them, so its
+    statement timeouts still hand the connection back, and is cancelled
+    once no caller is waiting for it. A caller whose time outlasts a shared
+    call that ran out of its deadline starts the call again.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await fn(), or join the call already running for key"""
+        self.calls += 1
+        deadline = current_deadline.get()
+        while True:
+            flight = self._in_flight.get(key)
+            if flight is None or flight.task.done():
+                flight = _Flight(fn, deadline)
+                self._in_flight[key] = flight
+                flight.task.add_done_callback(lambda done, flight=flight: self._forget(key, flight))
+            else:
+                self.coalesced += 1
+                flight.extend(deadline)
+            flight.waiters += 1
+            try:
+                # Shielded so one caller giving up doesn't cancel the query for everyone else
+                return await within_deadline(asyncio.shield(flight.task), "query")
+            except DeadlineExceeded:
+                # Ours passed, or the shared call ran out of a deadline shorter than ours
+                if not flight.task.done() or (deadline is not None and deadline <= time.monotonic()):
+                    raise
+            finally:
+                flight.waiters -= 1
+                if not flight.waiters:
+                    flight.task.cancel()
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._in_flight.get(key) is flight:
+            del self._in_flight[key]
+        if not flight.task.cancelled():
+            # Mark the exception retrieved even if every caller was cancelled
+            flight.task.exception()
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesce_rate": self.coalesced / self.calls if self.calls else 0.0,
+            "in_flight": len(self._in_flight),
+        }
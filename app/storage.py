@@ -0,0 +1,235 @@
+"""Storage backends for the Task API
+
+Database keeps everything in Postgres through asyncpg; MemoryBackend keeps it
+in process with the same results, for running the tests and benchmarks
+without a server. STORAGE_BACKEND picks one: postgres (default) or memory.
+"""
+import abc
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Whitelists for field projection and partial updates; nothing else is ever interpolated into SQL
+TASK_COLUMNS = ("id", "title", "description", "completed", "version")
+PATCHABLE_TASK_COLUMNS = ("title", "description", "completed")
+
+
+class CursorExpiredError(Exception):
+    """Tombstones needed to continue the change feed from a position have been purged"""
+
+
+def utc_naive(value: datetime) -> datetime:
+    """Timestamps are stored as UTC without a time zone, like created_at"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class StorageBackend(abc.ABC):
+    """Everything the API reads and writes, independent of where it is kept"""
+
+    # Sizes the default admission limits; backends without a pool keep this
+    pool_max_size = 10
+    tombstone_retention = 0.0
+    tombstone_purge_interval = 3600.0
+
+    @abc.abstractmethod
+    async def connect(self):
+        ...
+
+    @abc.abstractmethod
+    async def disconnect(self):
+        ...
+
+    @abc.abstractmethod
+    async def create_tables(self) -> List[str]:
+        """Bring the schema up to date, returning what was applied"""
+
+    @abc.abstractmethod
+    async def schema_is_current(self) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def subscribe_changes(self, on_change: Callable[[str, int], None], on_reset: Callable[[], None]) -> bool:
+        """Call on_change(op, task_id) for every task write, from any process
+
+        op is INSERT, UPDATE or DELETE. on_reset is called when changes may
+        have been missed. Returns False when changes can't be observed.
+        """
+
+    @asynccontextmanager
+    async def maintenance_lock(self, name: str) -> AsyncIterator[bool]:
+        """Whether this process should run the named background job now
+
+        Backends shared between processes let only one run it at a time.
+        """
+        yield True
+
+    def pool_connections(self) -> Dict[Tuple[str, str], int]:
+        """Open and idle connection counts for each connected pool"""
+        return {}
+
+    @abc.abstractmethod
+    def stats(self) -> Dict:
+        ...
+
+    @abc.abstractmethod
+    async def get_all_tasks(
+        self,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        completed: Optional[bool] = None,
+        created_after: Optional[datetime] = None,
+        columns: Sequence[str] = TASK_COLUMNS,
+        include_archived: bool = False,
+    ) -> List[Dict]:
+        ...
+
+    @abc.abstractmethod
+    def iter_tasks(
+        self,
+        batch_size: int = 1000,
+        completed: Optional[bool] = None,
+        created_after: Optional[datetime] = None,
+        include_archived: bool = False,
+    ) -> AsyncIterator[List[Dict]]:
+        ...
+
+    @abc.abstractmethod
+    async def get_task(self, task_id: int) -> Optional[Dict]:
+        ...
+
+    @abc.abstractmethod
+    async def get_archived_task(self, task_id: int) -> Optional[Dict]:
+        ...
+
+    @abc.abstractmethod
+    async def create_task(self, title: str, description: Optional[str], completed: bool) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def create_tasks(self, tasks: List[Tuple[str, Optional[str], bool]]) -> List[int]:
+        ...
+
+    @abc.abstractmethod
+    async def update_task(
+        self,
+        task_id: int,
+        title: str,
+        description: Optional[str],
+        completed: bool,
+        expected_version: Optional[int] = None,
+    ) -> Optional[int]:
+        """The task's new version, or None if it is missing or not at expected_version"""
+
+    @abc.abstractmethod
+    async def delete_task(self, task_id: int, expected_version: Optional[int] = None) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def patch_task(
+        self,
+        task_id: int,
+        changes: Dict,
+        expected_version: Optional[int] = None,
+    ) -> Optional[Dict]:
+        ...
+
+    @abc.abstractmethod
+    async def update_tasks(self, tasks: List[Tuple[int, str, Optional[str], bool]]) -> List[int]:
+        ...
+
+    @abc.abstractmethod
+    async def delete_tasks(self, task_ids: List[int]) -> List[int]:
+        ...
+
+    @abc.abstractmethod
+    async def run_batch(self, operations: List[Dict], atomic: bool = True) -> Tuple[bool, List[Dict]]:
+        """Run task writes in order in one transaction, returning whether it committed and their results
+
+        Operations are dicts with an op of create (title, description,
+        completed), update (id, title, description, completed), patch (id,
+        changes) or delete (id); all but create may carry expected_version.
+        Results are {"id", "task", "error"}, error being None, not_found,
+        version_conflict or invalid (with a detail). An atomic batch stops at
+        the first error, whose result comes last, and commits nothing;
+        otherwise failed operations are left out and the rest committed.
+        """
+
+    @abc.abstractmethod
+    async def get_task_stats(self) -> Dict:
+        """Total, completed and open task counts, without counting rows"""
+
+    @abc.abstractmethod
+    async def get_changes(self, after: Tuple[int, int] = (0, 0), limit: int = 100) -> Dict:
+        ...
+
+    @abc.abstractmethod
+    async def purge_tombstones(self, older_than: datetime) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def archive_tasks(self, older_than: datetime, batch_size: Optional[int] = None) -> int:
+        """Move tasks completed and unchanged since before older_than out of the hot set"""
+
+    @abc.abstractmethod
+    async def get_all_test_records(
+        self,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = None,
+        state: Optional[str] = None,
+        city: Optional[str] = None,
+        occupation: Optional[str] = None,
+    ) -> List[Dict]:
+        ...
+
+    @abc.abstractmethod
+    async def get_test_facets(self) -> Dict[str, List[Dict]]:
+        ...
+
+    @abc.abstractmethod
+    async def get_test_record(self, record_id: int) -> Optional[Dict]:
+        ...
+
+    @abc.abstractmethod
+    async def create_test_record(self, name: str, city: str, state: str, occupation: str) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def update_test_record(self, record_id: int, name: str, city: str, state: str, occupation: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    async def delete_test_record(self, record_id: int) -> bool:
+        ...
+
+    async def _purge_tombstones_periodically(self):
+        # Run straight away, or processes restarted more often than the interval would never run it
+        while True:
+            cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=self.tombstone_retention)
+            try:
+                async with self.maintenance_lock("tombstone_purge") as acquired:
+                    purged = await self.purge_tombstones(cutoff) if acquired else 0
+            except Exception as exc:
+                logger.warning("Tombstone purge failed: %s", exc)
+            else:
+                if purged:
+                    logger.info("Purged %d task tombstones", purged)
+            await asyncio.sleep(self.tombstone_purge_interval)
+
+
+def create_backend() -> StorageBackend:
+    """The backend named by STORAGE_BACKEND"""
+    name = os.getenv("STORAGE_BACKEND", "postgres").lower()
+    if name == "postgres":
+        from db import Database
+        return Database()
+    if name == "memory":
+        from memory import MemoryBackend
+        return MemoryBackend()
+    raise ValueError(f"Unknown STORAGE_BACKEND {name!r}; choose postgres or memory")
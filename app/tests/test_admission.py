@@ -0,0 +1,110 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from admission import AdmissionController, Overloaded
+from middleware import AdmissionControlMiddleware
+
+
+async def test_admits_up_to_concurrency():
+    """Test requests within the limit are admitted without waiting"""
+    controller = AdmissionController("test", concurrency=2, queue_size=0, queue_timeout=1)
+    await controller.acquire()
+    await controller.acquire()
+    with pytest.raises(Overloaded):
+        await controller.acquire()
+    controller.release()
+    await controller.acquire()
+
+
+async def test_queued_request_admitted_on_release():
+    """Test a waiting request gets the next free slot"""
+    controller = AdmissionController("test", concurrency=1, queue_size=1, queue_timeout=1)
+    await controller.acquire()
+    waiter = asyncio.ensure_future(controller.acquire())
+    await asyncio.sleep(0)
+    assert controller.stats()["waiting"] == 1
+    controller.release()
+    await waiter
+    assert controller.stats()["waiting"] == 0
+
+
+async def test_rejects_when_queue_full():
+    """Test shedding once the wait queue is full"""
+    controller = AdmissionController("test", concurrency=1, queue_size=1, queue_timeout=1)
+    await controller.acquire()
+    waiter = asyncio.ensure_future(controller.acquire())
+    await asyncio.sleep(0)
+    with pytest.raises(Overloaded):
+        await controller.acquire()
+    assert controller.stats()["rejected"] == 1
+    controller.release()
+    await waiter
+
+
+async def test_rejects_after_queue_timeout():
+    """Test a queued request gives up after the queue timeout"""
+    controller = AdmissionController("test", concurrency=1, queue_size=5, queue_timeout=0.01)
+    await controller.acquire()
+    with pytest.raises(Overloaded):
+        await controller.acquire()
+    assert controller.stats()["waiting"] == 0
+    controller.release()
+    await controller.acquire()
+
+
+async def test_middleware_sheds_with_503():
+    """Test overloaded writes get 503 with Retry-After while reads still pass"""
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope["method"] == "POST":
+            await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    middleware = AdmissionControlMiddleware(
+        app,
+        read=AdmissionController("read", concurrency=1, queue_size=0, queue_timeout=1),
+        write=AdmissionController("write", concurrency=1, queue_size=0, queue_timeout=1),
+        retry_after=3,
+    )
+    async with AsyncClient(app=middleware, base_url="http://test") as client:
+        first = asyncio.ensure_future(client.post("/tasks"))
+        await asyncio.sleep(0.05)
+        shed = await client.post("/tasks")
+        assert shed.status_code == 503
+        assert shed.headers["Retry-After"] == "3"
+        assert (await client.get("/tasks")).status_code == 200
+        release.set()
+        assert (await first).status_code == 200
+
+
+async def test_path_controller_keeps_exports_off_read_slots():
+    """Test a long download holds its own path's slot, not a read slot"""
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        if scope["path"] == "/tasks/export":
+            await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    middleware = AdmissionControlMiddleware(
+        app,
+        read=AdmissionController("read", concurrency=1, queue_size=0, queue_timeout=1),
+        write=AdmissionController("write", concurrency=1, queue_size=0, queue_timeout=1),
+        path_controllers={"/tasks/export": AdmissionController("export", concurrency=1, queue_size=0, queue_timeout=1)},
+    )
+    async with AsyncClient(app=middleware, base_url="http://test") as client:
+        export = asyncio.ensure_future(client.get("/tasks/export"))
+        await asyncio.sleep(0.05)
+        assert (await client.get("/tasks")).status_code == 200
+        assert (await client.get("/tasks/export")).status_code == 503
+        release.set()
+        assert (await export).status_code == 200
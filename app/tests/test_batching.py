@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+import sys
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from batching import InsertBatcher
+
+# Mark all tests in this file as async
+pytestmark = pytest.mark.asyncio
+
+
+class FakeTable:
+    """Stand-in for the tasks table that assigns sequential ids"""
+
+    def __init__(self, reject=None):
+        self.next_id = 1
+        self.statements = 0
+        self.reject = reject
+
+    def _insert(self, row):
+        if row == self.reject:
+            raise ValueError("rejected row")
+        task_id = self.next_id
+        self.next_id += 1
+        return task_id
+
+    async def insert_many(self, rows):
+        self.statements += 1
+        if self.reject in rows:
+            raise ValueError("rejected batch")
+        return [self._insert(row) for row in rows]
+
+    async def insert_one(self, row):
+        self.statements += 1
+        return self._insert(row)
+
+
+async def test_concurrent_inserts_share_one_statement():
+    """Test that rows submitted within the window are written together"""
+    table = FakeTable()
+    batcher = InsertBatcher(table.insert_many, table.insert_one, window=0.01, max_rows=100)
+
+    ids = await asyncio.gather(*(batcher.submit((f"Task {i}",)) for i in range(5)))
+    assert ids == [1, 2, 3, 4, 5]
+    assert table.statements == 1
+    assert batcher.stats()["rows_per_batch"] == 5
+
+
+async def test_full_batch_flushes_immediately():
+    """Test that reaching max_rows flushes without waiting for the window"""
+    table = FakeTable()
+    batcher = InsertBatcher(table.insert_many, table.insert_one, window=60, max_rows=2)
+
+    ids = await asyncio.wait_for(
+        asyncio.gather(batcher.submit(("a",)), batcher.submit(("b",))), timeout=1
+    )
+    assert ids == [1, 2]
+
+
+async def test_failing_row_only_fails_its_caller():
+    """Test that a bad row is isolated by the row-by-row fallback"""
+    table = FakeTable(reject=("bad",))
+    batcher = InsertBatcher(
+        table.insert_many, table.insert_one, window=0.01, max_rows=100, row_errors=(ValueError,)
+    )
+
+    results = await asyncio.gather(
+        batcher.submit(("good",)), batcher.submit(("bad",)), batcher.submit(("also good",)),
+        return_exceptions=True
+    )
+    assert results[0] == 1
+    assert isinstance(results[1], ValueError)
+    assert results[2] == 2
+    assert batcher.fallbacks == 1
+
+
+async def test_other_errors_fail_the_whole_batch():
+    """Test that errors no single row causes are not retried row by row"""
+    table = FakeTable()
+
+    async def insert_many(rows):
+        raise ConnectionError("connection lost")
+
+    batcher = InsertBatcher(insert_many, table.insert_one, window=0.01, max_rows=100, row_errors=(ValueError,))
+    results = await asyncio.gather(
+        batcher.submit(("a",)), batcher.submit(("b",)), return_exceptions=True
+    )
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert table.statements == 0
+    assert batcher.fallbacks == 0
+
+
+async def test_fallback_skips_rows_whose_callers_gave_up():
+    """Test that the row-by-row retry doesn't write rows already reported as failed"""
+    table = FakeTable(reject=("bad",))
+    failed = asyncio.Event()
+    insert_many = table.insert_many
+
+    async def slow_insert_many(rows):
+        await failed.wait()
+        return await insert_many(rows)
+
+    batcher = InsertBatcher(
+        slow_insert_many, table.insert_one, window=0.01, max_rows=100, row_errors=(ValueError,)
+    )
+    gave_up = asyncio.ensure_future(batcher.submit(("late",)))
+    bad = asyncio.ensure_future(batcher.submit(("bad",)))
+    await asyncio.sleep(0.02)
+    gave_up.cancel()
+    failed.set()
+    with pytest.raises(ValueError):
+        await bad
+    assert gave_up.cancelled()
+    assert table.next_id == 1
+
+
+async def test_close_flushes_pending_rows():
+    """Test that closing the batcher writes rows still waiting for the window"""
+    table = FakeTable()
+    batcher = InsertBatcher(table.insert_many, table.insert_one, window=60, max_rows=100)
+
+    pending = asyncio.ensure_future(batcher.submit(("late",)))
+    await asyncio.sleep(0)
+    await batcher.close()
+    assert await pending == 1
@@ -0,0 +1,37 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from benchmarks.load import compare, parse_args, percentile, run
+
+# Mark all tests in this file as async
+pytestmark = pytest.mark.asyncio
+
+
+async def test_inproc_run_covers_every_scenario():
+    """Test a tiny in-process run completes every scenario without errors"""
+    args = parse_args(["--requests", "5", "--concurrency", "2", "--bulk-size", "2", "--seed", "10", "--seed-records", "5"])
+    results = await run(args)
+    assert {"get_task", "task_changes", "list_records", "record_facets"} <= set(results["scenarios"])
+    for name, result in results["scenarios"].items():
+        assert result["errors"] == 0, name
+        assert result["p50_ms"] <= result["p99_ms"]
+
+
+async def test_compare_flags_regressions():
+    """Test that regressions beyond the threshold are reported"""
+    baseline = {"scenarios": {"get_task": {"p95_ms": 1.0, "throughput": 1000.0}}}
+    slower = {"scenarios": {"get_task": {"p95_ms": 1.5, "throughput": 700.0}}}
+    assert len(compare(slower, baseline, threshold=0.1)) == 2
+    assert compare(slower, baseline, threshold=0.6) == []
+
+
+async def test_percentile_nearest_rank():
+    """Test nearest-rank percentiles"""
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 0.50) == 50.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([], 0.5) == 0.0
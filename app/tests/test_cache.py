@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from cache import TTLCache
+
+
+def test_get_and_set():
+    """Test storing and reading back a value"""
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set(1, {"id": 1})
+    assert cache.get(1) == {"id": 1}
+    assert cache.get(2) is None
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_lru_eviction():
+    """Test that the least recently used entry is evicted first"""
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    cache.get(1)
+    cache.set(3, "c")
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.get(3) == "c"
+    assert cache.evictions == 1
+
+
+def test_ttl_expiry():
+    """Test that entries expire after the TTL"""
+    cache = TTLCache(max_entries=10, ttl=5)
+    with patch("cache.time.monotonic", return_value=100.0):
+        cache.set(1, "a")
+    with patch("cache.time.monotonic", return_value=106.0):
+        assert cache.get(1) is None
+    assert cache.expirations == 1
+    assert len(cache) == 0
+
+
+def test_invalidate_discards_racing_read():
+    """Test that a read started before an invalidation is not cached"""
+    cache = TTLCache(max_entries=10, ttl=60)
+    stamp = cache.stamp()
+    cache.invalidate(1)
+    cache.set(1, "stale", stamp)
+    assert cache.get(1) is None
+
+    cache.set(1, "fresh", cache.stamp())
+    assert cache.get(1) == "fresh"
+
+
+def test_disabled_cache():
+    """Test that a zero-sized cache stores nothing"""
+    cache = TTLCache(max_entries=0, ttl=60)
+    cache.set(1, "a")
+    assert cache.get(1) is None
+    assert cache.stats()["entries"] == 0
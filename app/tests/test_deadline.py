@@ -0,0 +1,205 @@
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from batching import InsertBatcher
+from db import Database
+from deadline import DeadlineExceeded, current_deadline, deadline_exceeded, time_left
+from singleflight import SingleFlight
+from metrics import DEADLINE_EXCEEDED
+from middleware import DeadlineMiddleware
+
+# Mark all tests in this file as async
+pytestmark = pytest.mark.asyncio
+
+
+class StuckPool:
+    """Pool whose connections never free up"""
+
+    async def acquire(self, timeout=None):
+        await asyncio.wait_for(asyncio.Event().wait(), timeout)
+
+    async def release(self, conn):
+        pass
+
+
+class SlowConnection:
+    """Connection whose statements outlast any timeout, like asyncpg's"""
+
+    async def fetch(self, query, *args, timeout=None):
+        await asyncio.wait_for(asyncio.Event().wait(), timeout)
+
+
+class SlowPool:
+    async def acquire(self, timeout=None):
+        return SlowConnection()
+
+    async def release(self, conn):
+        pass
+
+
+def _with_deadline(seconds):
+    return current_deadline.set(time.monotonic() + seconds)
+
+
+async def test_time_left():
+    """Test the remaining budget, and expiry once it is spent"""
+    assert time_left("query") is None
+    token = _with_deadline(5)
+    try:
+        assert 4 < time_left("query") <= 5
+    finally:
+        current_deadline.reset(token)
+
+    expired = DEADLINE_EXCEEDED.labels("query")
+    before = expired.value
+    token = _with_deadline(-1)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            time_left("query")
+    finally:
+        current_deadline.reset(token)
+    assert expired.value == before + 1
+
+
+async def test_acquire_wait_bounded_by_deadline():
+    """Test a pool wait gives up at the deadline rather than the acquire timeout"""
+    db = Database()
+    db.pool = StuckPool()
+    db.acquire_timeout = 30
+    token = _with_deadline(0.05)
+    try:
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded, match="acquire"):
+            await db.get_test_record(1)
+        assert time.monotonic() - started < 1
+    finally:
+        current_deadline.reset(token)
+
+
+async def test_statement_cancelled_at_deadline():
+    """Test statements get what is left of the deadline as their timeout"""
+    db = Database()
+    db.pool = SlowPool()
+    token = _with_deadline(0.05)
+    try:
+        with pytest.raises(DeadlineExceeded, match="query"):
+            await db.get_all_test_records()
+    finally:
+        current_deadline.reset(token)
+
+
+async def _call_with_deadline(seconds, fn):
+    token = _with_deadline(seconds)
+    try:
+        return await fn()
+    finally:
+        current_deadline.reset(token)
+
+
+async def test_coalesced_read_keeps_each_callers_deadline():
+    """Test a joiner outlives the leader's deadline, and the shared call runs until the later one"""
+    seen = []
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        seen.append(time_left("query"))
+        return "row"
+
+    flight = SingleFlight()
+    leader = asyncio.ensure_future(_call_with_deadline(0.02, lambda: flight.do("key", fetch)))
+    await asyncio.sleep(0)
+    joiner = asyncio.ensure_future(_call_with_deadline(5, lambda: flight.do("key", fetch)))
+    with pytest.raises(DeadlineExceeded):
+        await leader
+    assert await joiner == "row"
+    assert len(seen) == 1 and 4 < seen[0] <= 5
+
+
+async def test_abandoned_shared_read_is_cancelled():
+    """Test the shared call stops, freeing its connection, once every caller has given up"""
+    cancelled = asyncio.Event()
+
+    async def fetch():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    flight = SingleFlight()
+    with pytest.raises(DeadlineExceeded):
+        await _call_with_deadline(0.02, lambda: flight.do("key", fetch))
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert flight.stats()["in_flight"] == 0
+
+
+async def test_coalesced_read_retried_when_shared_deadline_ran_out():
+    """Test a caller with time left starts the call again when the shared one timed out"""
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0)
+        if calls == 1:
+            raise deadline_exceeded("query")
+        return "row"
+
+    flight = SingleFlight()
+    assert await _call_with_deadline(5, lambda: flight.do("key", fetch)) == "row"
+    assert calls == 2
+
+
+async def test_batched_insert_keeps_each_callers_deadline():
+    """Test one caller's short deadline neither fails its batch nor has its row written"""
+    written = []
+
+    async def insert_many(rows):
+        assert current_deadline.get() is None
+        await asyncio.sleep(0.05)
+        written.extend(rows)
+        return list(range(1, len(rows) + 1))
+
+    async def insert_one(row):
+        raise AssertionError("batch should not fall back")
+
+    batcher = InsertBatcher(insert_many, insert_one, window=0.03)
+    hasty = asyncio.ensure_future(_call_with_deadline(0.01, lambda: batcher.submit(("hasty",))))
+    patient = asyncio.ensure_future(_call_with_deadline(5, lambda: batcher.submit(("patient",))))
+    with pytest.raises(DeadlineExceeded):
+        await hasty
+    assert await patient == 1
+    assert written == [("patient",)]
+
+
+async def test_middleware_picks_budget():
+    """Test the header, capped, wins over route defaults, which win over the default"""
+    seen = {}
+
+    async def endpoint(request):
+        seen[request.url.path] = current_deadline.get() and current_deadline.get() - time.monotonic()
+        return JSONResponse({})
+
+    app = Starlette(routes=[Route("/fast", endpoint), Route("/stream", endpoint)])
+    wrapped = DeadlineMiddleware(app, default=2.0, max_timeout=5.0, route_timeouts={"/stream": None})
+    async with AsyncClient(app=wrapped, base_url="http://test") as client:
+        await client.get("/fast")
+        assert 1 < seen["/fast"] <= 2
+        await client.get("/stream")
+        assert seen["/stream"] is None
+        await client.get("/fast", headers={"X-Request-Timeout": "60"})
+        assert 4 < seen["/fast"] <= 5
+        await client.get("/fast", headers={"X-Request-Timeout": "0.5"})
+        assert seen["/fast"] <= 0.5
+        await client.get("/fast", headers={"X-Request-Timeout": "soon"})
+        assert 1 < seen["/fast"] <= 2
@@ -0,0 +1,96 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from events import TaskEventBroker, TooManySubscribers
+
+
+async def test_events_fan_out_to_subscribers():
+    """Test every subscriber receives published changes in order"""
+    broker = TaskEventBroker()
+    first, second = broker.subscribe(), broker.subscribe()
+    broker.publish("INSERT", 1)
+    broker.publish("DELETE", 1)
+    for subscriber in (first, second):
+        events = await subscriber.next_events()
+        assert [(event.name, event.task_id) for event in events] == [("created", 1), ("deleted", 1)]
+
+
+async def test_subscriber_waits_for_events():
+    """Test an idle subscriber wakes up on the next change"""
+    broker = TaskEventBroker()
+    subscriber = broker.subscribe()
+    waiting = asyncio.ensure_future(subscriber.next_events())
+    await asyncio.sleep(0)
+    assert not waiting.done()
+    broker.publish("UPDATE", 3)
+    assert [event.name for event in await waiting] == ["updated"]
+
+
+async def test_slow_subscriber_is_evicted():
+    """Test a subscriber that falls behind is evicted without affecting others"""
+    broker = TaskEventBroker(queue_size=2)
+    slow, fast = broker.subscribe(), broker.subscribe()
+    broker.publish("INSERT", 1)
+    broker.publish("INSERT", 2)
+    assert len(await fast.next_events()) == 2
+    broker.publish("INSERT", 3)
+    assert slow.evicted
+    assert not fast.evicted
+    assert broker.evictions == 1
+    assert len(await slow.next_events()) == 2
+    assert await slow.next_events() == []
+
+
+async def test_resume_from_last_event_id():
+    """Test replaying buffered events after Last-Event-ID"""
+    broker = TaskEventBroker()
+    broker.publish("INSERT", 1)
+    broker.publish("INSERT", 2)
+    broker.publish("INSERT", 3)
+    last_seen = broker._history[0].id
+    resumed = broker.subscribe(last_seen)
+    assert [event.task_id for event in await resumed.next_events()] == [2, 3]
+
+
+async def test_unknown_last_event_id_gets_reset():
+    """Test resuming from an id the buffer no longer covers asks the client to refetch"""
+    broker = TaskEventBroker(buffer_size=2)
+    for task_id in range(5):
+        broker.publish("INSERT", task_id)
+    for last_event_id in (f"{broker.epoch}-1", "other-3", "garbage"):
+        events = await broker.subscribe(last_event_id).next_events()
+        assert [event.name for event in events] == ["reset"]
+
+
+async def test_listener_reset_is_broadcast():
+    """Test subscribers are told to refetch when notifications may have been missed"""
+    broker = TaskEventBroker()
+    subscriber = broker.subscribe()
+    broker.reset()
+    assert [event.name for event in await subscriber.next_events()] == ["reset"]
+
+
+async def test_max_subscribers_and_unsubscribe():
+    """Test the subscriber limit"""
+    broker = TaskEventBroker(max_subscribers=1)
+    subscriber = broker.subscribe()
+    with pytest.raises(TooManySubscribers):
+        broker.subscribe()
+    broker.unsubscribe(subscriber)
+    broker.subscribe()
+
+
+async def test_keepalive_wakes_idle_subscribers():
+    """Test idle subscribers are woken with no events so streams can send keepalives"""
+    broker = TaskEventBroker(keepalive_interval=0.01)
+    subscriber = broker.subscribe()
+    await broker.start()
+    try:
+        assert await asyncio.wait_for(subscriber.next_events(), timeout=1) == []
+    finally:
+        await broker.stop()
@@ -1,36 +1,53 @@
+import os
 import pytest
 import pytest_asyncio
 import sys
 from pathlib import Path
+from unittest.mock import patch
+from httpx import AsyncClient
 
 # Add parent directory to path to import app modules
 sys.path.insert(0, str(Path(__file__).parent.parent))
+import main
 from db import Database
+from storage import create_backend
 
 # Mark all tests in this file as async
 pytestmark = pytest.mark.asyncio
 
+# The suite runs against whichever backend STORAGE_BACKEND selects; these tests poke at Postgres internals
+postgres_only = pytest.mark.skipif(
+    os.getenv("STORAGE_BACKEND", "postgres").lower() != "postgres",
+    reason="exercises the asyncpg backend's pool, caches or SQL",
+)
+
 
 @pytest_asyncio.fixture
 async def db():
-    """Database fixture that handles connection and cleanup"""
-    database = Database()
+    """Backend fixture that handles connection and cleanup"""
+    database = create_backend()
     await database.connect()
     await database.create_tables()
     yield database
     # Cleanup: drop all test data
-    if database.pool is not None:
-        async with database.pool.acquire() as conn:
-            await conn.execute("DELETE FROM tasks")
+    if isinstance(database, Database):
+        if database.pool is not None:
+            async with database.pool.acquire() as conn:
+                await conn.execute("DELETE FROM tasks")
+                await conn.execute("DELETE FROM tasks_archive")
+            await database.disconnect()
+    else:
         await database.disconnect()
 
 
+@postgres_only
 async def test_database_connection(db):
     """Test database pool connection"""
     assert db.pool is not None
     assert db.pool.get_size() > 0
 
 
+@postgres_only
 async def test_create_tables(db):
     """Test table creation"""
     # Verify table exists
@@ -102,7 +119,7 @@ async def test_update_task(db):
     
     # Update it
     updated = await db.update_task(task_id, "Updated", "New Desc", True)
-    assert updated is True
+    assert updated == 2
     
     # Verify update
     task = await db.get_task(task_id)
@@ -114,7 +131,7 @@ async def test_update_task(db):
 async def test_update_task_not_found(db):
     """Test updating a task that doesn't exist"""
     updated = await db.update_task(99999, "Title", "Desc", False)
-    assert updated is False
+    assert updated is None
 
 
 async def test_delete_task(db):
@@ -154,7 +171,7 @@ async def test_crud_operations(db):
     
     # Update
     updated = await db.update_task(task_id, "Updated CRUD", "Modified", True)
-    assert updated is True
+    assert updated == 2
     
     task = await db.get_task(task_id)
     assert task["title"] == "Updated CRUD"
@@ -167,3 +184,406 @@ async def test_crud_operations(db):
     task = await db.get_task(task_id)
     assert task is None
 
+
+async def test_get_all_tasks_paginated(db):
+    """Test keyset pagination over tasks"""
+    ids = [await db.create_task(f"Page {i}", None, False) for i in range(5)]
+
+    first_page = await db.get_all_tasks(after_id=ids[0] - 1, limit=2)
+    assert [task["id"] for task in first_page] == ids[:2]
+
+    second_page = await db.get_all_tasks(after_id=first_page[-1]["id"], limit=2)
+    assert [task["id"] for task in second_page] == ids[2:4]
+
+
+async def test_get_all_tasks_filtered(db):
+    """Test filtering tasks by completion state"""
+    open_id = await db.create_task("Open", None, False)
+    done_id = await db.create_task("Done", None, True)
+
+    tasks = await db.get_all_tasks(completed=True)
+    task_ids = [task["id"] for task in tasks]
+    assert done_id in task_ids
+    assert open_id not in task_ids
+
+
+async def test_iter_tasks_batches(db):
+    """Test streaming tasks through a server-side cursor"""
+    for i in range(5):
+        await db.create_task(f"Export {i}", None, i % 2 == 0)
+
+    batches = [batch async for batch in db.iter_tasks(batch_size=2)]
+    assert all(len(batch) <= 2 for batch in batches)
+    exported = [task for batch in batches for task in batch]
+    assert len(exported) >= 5
+    assert [task["id"] for task in exported] == sorted(task["id"] for task in exported)
+
+
+async def test_create_tasks_bulk(db):
+    """Test bulk creation returns ids in input order"""
+    db.bulk_chunk_size = 2
+    ids = await db.create_tasks([
+        ("Bulk A", None, False),
+        ("Bulk B", "Desc", True),
+        ("Bulk C", None, False)
+    ])
+    assert len(ids) == 3
+    assert ids == sorted(ids)
+
+    tasks = [await db.get_task(task_id) for task_id in ids]
+    assert [task["title"] for task in tasks] == ["Bulk A", "Bulk B", "Bulk C"]
+    assert tasks[1]["completed"] is True
+
+
+async def test_update_and_delete_tasks_bulk(db):
+    """Test bulk update and delete report only existing ids"""
+    db.bulk_chunk_size = 1
+    first = await db.create_task("Bulk Update 1", None, False)
+    second = await db.create_task("Bulk Update 2", None, False)
+
+    updated = await db.update_tasks([
+        (first, "Closed 1", None, True),
+        (second, "Closed 2", "Done", True),
+        (99999, "Missing", None, True)
+    ])
+    assert sorted(updated) == [first, second]
+    assert (await db.get_task(second))["description"] == "Done"
+
+    deleted = await db.delete_tasks([first, 99999])
+    assert deleted == [first]
+    assert await db.get_task(first) is None
+
+
+@postgres_only
+async def test_get_task_cached(db):
+    """Test that reads are cached and writes invalidate the cache"""
+    task_id = await db.create_task("Cached", None, False)
+
+    # create_task populates the cache
+    assert (await db.get_task(task_id))["title"] == "Cached"
+    assert db.task_cache.hits == 1
+
+    await db.update_task(task_id, "Changed", None, True)
+    task = await db.get_task(task_id)
+    assert task["title"] == "Changed"
+    assert db.task_cache.misses == 1
+
+    await db.delete_task(task_id)
+    assert await db.get_task(task_id) is None
+
+
+@postgres_only
+async def test_change_notification_invalidates_cache(db):
+    """Test that a write from another connection evicts the cached task"""
+    import asyncio
+    task_id = await db.create_task("Shared", None, False)
+    assert (await db.get_task(task_id))["title"] == "Shared"
+
+    # Simulate another replica writing directly to the table
+    async with db.pool.acquire() as conn:
+        await conn.execute("UPDATE tasks SET title = 'Remote' WHERE id = $1", task_id)
+
+    for _ in range(50):
+        if task_id not in db.task_cache._entries:
+            break
+        await asyncio.sleep(0.05)
+    assert (await db.get_task(task_id))["title"] == "Remote"
+
+
+@postgres_only
+async def test_concurrent_reads_coalesced(db):
+    """Test that concurrent identical reads share one query"""
+    import asyncio
+    task_id = await db.create_task("Hot", None, False)
+    db.task_cache.clear()
+
+    results = await asyncio.gather(*(db.get_task(task_id) for _ in range(10)))
+    assert all(task["title"] == "Hot" for task in results)
+    assert db.reads.stats()["coalesced"] > 0
+
+
+@postgres_only
+async def test_create_task_write_batching(db):
+    """Test that batched creates resolve each caller with its own id"""
+    import asyncio
+    from batching import InsertBatcher
+    db.write_batcher = InsertBatcher(db._insert_task_batch, db._insert_task, window=0.01)
+
+    ids = await asyncio.gather(*(db.create_task(f"Batched {i}", None, False) for i in range(5)))
+    assert len(set(ids)) == 5
+    assert db.write_batcher.batches == 1
+    for i, task_id in enumerate(ids):
+        assert (await db.get_task(task_id))["title"] == f"Batched {i}"
+
+
+async def test_update_task_versions(db):
+    """Test that updates bump the version and honour the expected version"""
+    task_id = await db.create_task("Versioned", None, False)
+    assert (await db.get_task(task_id))["version"] == 1
+
+    assert await db.update_task(task_id, "V2", None, False, expected_version=1) == 2
+    assert (await db.get_task(task_id))["version"] == 2
+
+    assert await db.update_task(task_id, "Stale", None, False, expected_version=1) is None
+    assert await db.delete_task(task_id, expected_version=1) is False
+    assert await db.delete_task(task_id, expected_version=2) is True
+
+
+async def test_migrations_are_idempotent(db):
+    """Test that re-running migrations applies nothing and the schema is current"""
+    assert await db.create_tables() == []
+    assert await db.schema_is_current() is True
+
+
+@postgres_only
+async def test_pool_metrics(db):
+    """Test pool wait timing and connection counts"""
+    from metrics import DB_POOL_ACQUIRE_WAIT, DB_QUERY_DURATION
+
+    waits = sum(DB_POOL_ACQUIRE_WAIT.labels("primary").counts)
+    calls = sum(DB_QUERY_DURATION.labels("get_all_tasks").counts)
+    await db.get_all_tasks()
+    assert sum(DB_POOL_ACQUIRE_WAIT.labels("primary").counts) == waits + 1
+    assert sum(DB_QUERY_DURATION.labels("get_all_tasks").counts) == calls + 1
+    counts = db.pool_connections()
+    assert counts[("primary", "open")] >= counts[("primary", "idle")]
+
+
+@postgres_only
+async def test_request_timing_and_explain(db):
+    """Test per-request database time and capturing a slow query's plan"""
+    from timing import RequestTiming, current_timing
+
+    timing = RequestTiming()
+    token = current_timing.set(timing)
+    try:
+        await db.get_all_tasks()
+    finally:
+        current_timing.reset(token)
+    assert timing.acquires == 1
+    assert timing.db_time > 0
+
+    plan = await db._explain("SELECT id FROM tasks WHERE id = $1", (1,))
+    assert "Scan" in plan
+    assert "Buffers" in plan or "Planning" in plan
+
+
+@postgres_only
+async def test_pool_acquire_timeout(db):
+    """Test giving up on an exhausted pool instead of queueing forever"""
+    from contextlib import AsyncExitStack
+    from db import PoolTimeoutError
+
+    db.acquire_timeout = 0.05
+    async with AsyncExitStack() as stack:
+        for _ in range(db.pool_max_size):
+            await stack.enter_async_context(db._acquire(db.pool))
+        with pytest.raises(PoolTimeoutError):
+            await db.get_all_tasks()
+
+
+async def test_task_change_feed(db):
+    """Test that the change feed returns updates and deletes after a position"""
+    start = await db.get_changes()
+    while start["has_more"]:
+        start = await db.get_changes(start["position"])
+
+    kept = await db.create_task("Kept", None, False)
+    removed = await db.create_task("Removed", None, False)
+    await db.update_task(kept, "Kept", "edited", True)
+    await db.delete_task(removed)
+
+    changes = await db.get_changes(start["position"])
+    assert [task["id"] for task in changes["changes"]] == [kept]
+    assert changes["changes"][0]["version"] == 2
+    assert changes["deleted"] == [removed]
+    assert changes["position"] > start["position"]
+
+    again = await db.get_changes(changes["position"])
+    assert again["changes"] == [] and again["deleted"] == []
+
+
+async def test_change_feed_cursor_expires_after_purge(db):
+    """Test that purging tombstones expires positions that relied on them"""
+    from datetime import datetime, timedelta
+    from db import CursorExpiredError
+
+    task_id = await db.create_task("Short-lived", None, False)
+    position = (await db.get_changes((0, 0), limit=10000))["position"]
+    await db.delete_task(task_id)
+    await db.get_changes(position)
+    assert await db.purge_tombstones(datetime.utcnow() + timedelta(minutes=1)) >= 1
+    with pytest.raises(CursorExpiredError):
+        await db.get_changes(position)
+
+
+async def test_change_notifications_reach_stream_subscribers(db):
+    """Test task writes arrive as stream events through the backend's change notifications"""
+    import asyncio
+    from events import TaskEventBroker
+
+    broker = TaskEventBroker()
+    assert db.subscribe_changes(broker.publish, broker.reset) is True
+    subscriber = broker.subscribe()
+    task_id = await db.create_task("Streamed", None, False)
+    events = await asyncio.wait_for(subscriber.next_events(), timeout=5)
+    assert ("created", task_id) in [(event.name, event.task_id) for event in events]
+
+
+async def test_patch_task_and_projection(db):
+    """Test partial updates leave other columns alone and projections narrow rows"""
+    task_id = await db.create_task("Partial", "keep me", False)
+    task = await db.patch_task(task_id, {"completed": True})
+    assert task == {"id": task_id, "title": "Partial", "description": "keep me", "completed": True, "version": 2}
+    assert await db.patch_task(task_id, {"title": "Stale"}, expected_version=1) is None
+
+    rows = await db.get_all_tasks(columns=("id", "title"))
+    assert {"id": task_id, "title": "Partial"} in rows
+
+
+async def test_record_facets_follow_writes(db):
+    """Test trigger-maintained facet counts track inserts, updates and deletes"""
+    if isinstance(db, Database):
+        async with db.pool.acquire() as conn:
+            await conn.execute("DELETE FROM test")
+    first = await db.create_test_record("Ann", "Austin", "TX", "Nurse")
+    await db.create_test_record("Bob", "Dallas", "TX", "Chef")
+    await db.update_test_record(first, "Ann", "Reno", "NV", "Nurse")
+    facets = await db.get_test_facets()
+    assert {"value": "TX", "count": 1} in facets["state"]
+    assert {"value": "NV", "count": 1} in facets["state"]
+    assert {"value": "Nurse", "count": 1} in facets["occupation"]
+
+    await db.delete_test_record(first)
+    facets = await db.get_test_facets()
+    assert [entry["value"] for entry in facets["state"]] == ["TX"]
+
+    records = await db.get_all_test_records(state="TX", limit=10)
+    assert [record["name"] for record in records] == ["Bob"]
+
+
+async def test_task_stats_follow_writes(db):
+    """Test sharded counters track inserts, completion changes and deletes"""
+    before = await db.get_task_stats()
+    ids = await db.create_tasks([("Counted", None, True), ("Counted", None, False)])
+    await db.update_task(ids[1], "Counted", None, True)
+    await db.delete_task(ids[0])
+    after = await db.get_task_stats()
+    assert after["total"] == before["total"] + 1
+    assert after["completed"] == before["completed"] + 1
+    assert after["open"] == after["total"] - after["completed"]
+
+
+async def test_task_stats_endpoint(db):
+    """Test the stats endpoint serializes the backend's counts"""
+    await db.create_tasks([("Counted", None, True), ("Counted", None, False)])
+    expected = await db.get_task_stats()
+    with patch.object(main, "db", db):
+        async with AsyncClient(app=main.app, base_url="http://test") as client:
+            response = await client.get("/tasks/stats")
+    assert response.status_code == 200
+    assert response.json() == expected
+
+
+@postgres_only
+async def test_tasks_partitioned_by_month(db):
+    """Test new tasks land in a monthly partition, not the default one"""
+    task_id = await db.create_task("Partitioned", None, False)
+    assert await db.create_task_partitions() == 0
+    async with db.pool.acquire() as conn:
+        partition = await conn.fetchval("SELECT tableoid::regclass::text FROM tasks WHERE id = $1", task_id)
+    assert partition.startswith("tasks_")
+    assert partition != "tasks_default"
+
+
+async def test_archive_completed_tasks(db):
+    """Test archiving moves old completed tasks out of hot reads in batches"""
+    from datetime import datetime, timedelta
+
+    ids = await db.create_tasks([("Archive me", None, True), ("Me too", None, True), ("Open", None, False)])
+    # Everything completed so far counts as old enough
+    archived = await db.archive_tasks(datetime.utcnow() + timedelta(minutes=1), batch_size=1)
+    assert archived >= 2
+    assert await db.get_task(ids[0]) is None
+    assert (await db.get_archived_task(ids[1]))["title"] == "Me too"
+    hot = [task["id"] for task in await db.get_all_tasks()]
+    assert ids[2] in hot and ids[0] not in hot
+    everything = [task["id"] for task in await db.get_all_tasks(include_archived=True)]
+    assert set(ids) <= set(everything)
+    assert everything == sorted(everything)
+
+
+async def test_batch_atomic_and_continue(db):
+    """Test an atomic batch rolls back on the first failure and a continue batch commits the rest"""
+    task_id = await db.create_task("Batched", None, False)
+    operations = [
+        {"op": "create", "title": "Batch new", "description": None, "completed": False},
+        {"op": "update", "id": task_id, "title": "Batched", "description": "edited", "completed": True,
+         "expected_version": 1},
+        {"op": "delete", "id": task_id, "expected_version": 1},
+        {"op": "delete", "id": 999999999},
+    ]
+
+    committed, results = await db.run_batch(operations, atomic=True)
+    assert committed is False
+    assert results[-1]["error"] == "version_conflict"
+    assert (await db.get_task(task_id))["version"] == 1
+    assert "Batch new" not in [task["title"] for task in await db.get_all_tasks()]
+
+    committed, results = await db.run_batch(operations, atomic=False)
+    assert committed is True
+    assert [result["error"] for result in results] == [None, None, "version_conflict", "not_found"]
+    assert results[1]["task"]["version"] == 2
+    assert (await db.get_task(results[0]["id"]))["title"] == "Batch new"
+    task = await db.get_task(task_id)
+    assert (task["description"], task["completed"]) == ("edited", True)
+
+
+@postgres_only
+async def test_batch_failed_statement_only_undoes_itself(db):
+    """Test a statement error inside a continue batch is rolled back to its savepoint"""
+    task_id = await db.create_task("Savepoint", None, False)
+    committed, results = await db.run_batch([
+        {"op": "patch", "id": task_id, "changes": {"title": "x" * 300}},
+        {"op": "patch", "id": task_id, "changes": {"completed": True}},
+    ], atomic=False)
+    assert committed is True
+    assert results[0]["error"] == "invalid"
+    assert results[1]["task"]["completed"] is True
+
+    committed, results = await db.run_batch([
+        {"op": "patch", "id": task_id, "changes": {"completed": False}},
+        {"op": "patch", "id": task_id, "changes": {"title": "x" * 300}},
+    ], atomic=True)
+    assert committed is False
+    assert (await db.get_task(task_id))["completed"] is True
+
+
+@postgres_only
+async def test_maintenance_lock_runs_one_process_at_a_time(db):
+    """Test a second holder of a maintenance lock is told to skip the job"""
+    async with db.maintenance_lock("task_maintenance") as first:
+        async with db.maintenance_lock("task_maintenance") as second:
+            assert (first, second) == (True, False)
+    async with db.maintenance_lock("task_maintenance") as again:
+        assert again is True
+
+
+@postgres_only
+async def test_partition_creation_moves_default_partition_stragglers(db):
+    """Test rows that landed in the default partition move into their month's new partition"""
+    async with db.pool.acquire() as conn:
+        task_id = await conn.fetchval(
+            """
+            INSERT INTO tasks (title, created_at)
+            VALUES ('Straggler', date_trunc('month', LOCALTIMESTAMP) + INTERVAL '8 months')
+            RETURNING id
+            """
+        )
+    db.partitions_ahead = 9
+    await db.create_task_partitions()
+    async with db.pool.acquire() as conn:
+        partition = await conn.fetchval("SELECT tableoid::regclass::text FROM tasks WHERE id = $1", task_id)
+    assert partition.startswith("tasks_") and partition != "tasks_default"
+    assert (await db.get_task(task_id))["title"] == "Straggler"
+    assert await db.create_task_partitions() == 0
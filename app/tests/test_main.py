@@ -6,6 +6,7 @@ from pathlib import Path
 
 # Add parent directory to path to import app modules
 sys.path.insert(0, str(Path(__file__).parent.parent))
+from db import Database
 from main import app, db
 
 # Set test database URL
@@ -33,7 +34,7 @@ async def client_with_db():
         yield ac
     
     # Cleanup: disconnect database
-    if db.pool is not None:
+    if not isinstance(db, Database) or db.pool is not None:
         await db.disconnect()
 
 
@@ -0,0 +1,188 @@
+import asyncio
+import pytest
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from memory import MemoryBackend
+from storage import CursorExpiredError, create_backend
+
+# Mark all tests in this file as async
+pytestmark = pytest.mark.asyncio
+
+
+async def test_create_backend_from_environment(monkeypatch):
+    """Test STORAGE_BACKEND selects the backend and rejects unknown names"""
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    assert isinstance(create_backend(), MemoryBackend)
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    with pytest.raises(ValueError):
+        create_backend()
+
+
+async def test_filtered_scans_follow_index_changes():
+    """Test the completed index tracks updates, patches and deletes"""
+    db = MemoryBackend()
+    ids = await db.create_tasks([(f"Task {i}", None, i % 2 == 0) for i in range(6)])
+    await db.update_task(ids[1], "Task 1", None, True)
+    await db.patch_task(ids[0], {"completed": False})
+    await db.delete_task(ids[2])
+
+    done = await db.get_all_tasks(completed=True)
+    assert [task["id"] for task in done] == [ids[1], ids[4]]
+    page = await db.get_all_tasks(after_id=ids[1], limit=1, completed=True, columns=("id",))
+    assert page == [{"id": ids[4]}]
+
+
+async def test_bulk_delete_rebuilds_indexes():
+    """Test deleting many rows at once keeps ids and index lists sorted and complete"""
+    db = MemoryBackend()
+    ids = await db.create_tasks([(f"Task {i}", None, i % 3 == 0) for i in range(100)])
+    assert await db.delete_tasks(ids[10:60] + [99999]) == ids[10:60]
+
+    remaining = ids[:10] + ids[60:]
+    assert [task["id"] for task in await db.get_all_tasks()] == remaining
+    open_tasks = await db.get_all_tasks(completed=False)
+    assert [task["id"] for task in open_tasks] == [task_id for task_id in remaining if (task_id - ids[0]) % 3]
+
+
+async def test_iter_tasks_is_a_snapshot():
+    """Test writes made while exporting don't show up in later batches"""
+    db = MemoryBackend()
+    ids = await db.create_tasks([(f"Export {i}", None, False) for i in range(4)])
+    batches = db.iter_tasks(batch_size=2)
+    first = await batches.__anext__()
+    await db.update_task(ids[3], "Changed", None, True)
+    second = await batches.__anext__()
+    assert [task["id"] for task in first + second] == ids
+    assert second[1]["title"] == "Export 3"
+
+
+async def test_change_feed_pages_and_skips_superseded_writes():
+    """Test each task appears once, at its latest write, across pages"""
+    db = MemoryBackend()
+    ids = await db.create_tasks([(f"Feed {i}", None, False) for i in range(3)])
+    await db.update_task(ids[0], "Feed 0", "again", False)
+    await db.delete_task(ids[1])
+
+    first = await db.get_changes(limit=1)
+    assert [task["id"] for task in first["changes"]] == [ids[2]]
+    assert first["has_more"] is True
+    rest = await db.get_changes(first["position"], limit=10)
+    assert [task["id"] for task in rest["changes"]] == [ids[0]]
+    assert rest["deleted"] == [ids[1]]
+    assert rest["has_more"] is False
+
+    # Positions past the end only match later writes
+    await db.create_task("Later", None, False)
+    later = await db.get_changes(rest["position"])
+    assert [task["title"] for task in later["changes"]] == ["Later"]
+
+
+async def test_purged_tombstones_expire_positions():
+    """Test purging tombstones raises for positions that needed them"""
+    db = MemoryBackend()
+    task_id = await db.create_task("Short-lived", None, False)
+    position = (await db.get_changes())["position"]
+    await db.delete_task(task_id)
+    assert await db.purge_tombstones(datetime.utcnow() - timedelta(minutes=1)) == 0
+    assert await db.purge_tombstones(datetime.utcnow() + timedelta(minutes=1)) == 1
+    with pytest.raises(CursorExpiredError):
+        await db.get_changes(position)
+    assert (await db.get_changes())["deleted"] == []
+
+
+async def test_tombstone_purge_runs_on_connect():
+    """Test the first purge doesn't wait a whole interval, which restarts could keep postponing"""
+    db = MemoryBackend()
+    db.tombstone_retention = 0.001
+    db.tombstone_purge_interval = 3600
+    await db.delete_task(await db.create_task("Short-lived", None, False))
+    await asyncio.sleep(0.01)
+    await db.connect()
+    try:
+        await asyncio.sleep(0)
+        assert (await db.get_changes())["deleted"] == []
+    finally:
+        await db.disconnect()
+
+
+async def test_change_callbacks():
+    """Test subscribers hear about every write with its operation"""
+    db = MemoryBackend()
+    seen = []
+    assert db.subscribe_changes(lambda op, task_id: seen.append((op, task_id)), lambda: None) is True
+    task_id = await db.create_task("Heard", None, False)
+    await db.patch_task(task_id, {"title": "Heard twice"})
+    await db.delete_tasks([task_id])
+    assert seen == [("INSERT", task_id), ("UPDATE", task_id), ("DELETE", task_id)]
+
+
+async def test_facets_order_and_null_values():
+    """Test facet counts order by count, then value, with nulls last"""
+    db = MemoryBackend()
+    await db.create_test_record("Ann", "Austin", "TX", None)
+    await db.create_test_record("Bob", "Boston", "MA", "Chef")
+    record_id = await db.create_test_record("Cy", "Dallas", "TX", "Chef")
+    facets = await db.get_test_facets()
+    assert facets["state"] == [{"value": "TX", "count": 2}, {"value": "MA", "count": 1}]
+    assert facets["occupation"] == [{"value": "Chef", "count": 2}, {"value": None, "count": 1}]
+
+    await db.update_test_record(record_id, "Cy", "Reno", "NV", "Pilot")
+    await db.delete_test_record(1)
+    facets = await db.get_test_facets()
+    assert facets["state"] == [{"value": "MA", "count": 1}, {"value": "NV", "count": 1}]
+    assert [record["name"] for record in await db.get_all_test_records(city="Reno")] == ["Cy"]
+
+
+async def test_task_stats_follow_writes():
+    """Test the completed counter tracks every kind of write"""
+    db = MemoryBackend()
+    ids = await db.create_tasks([("A", None, True), ("B", None, False), ("C", None, False)])
+    await db.update_tasks([(ids[1], "B", None, True)])
+    await db.patch_task(ids[0], {"completed": False})
+    await db.delete_task(ids[1])
+    assert await db.get_task_stats() == {"total": 2, "completed": 0, "open": 2}
+
+
+async def test_archive_moves_old_completed_tasks():
+    """Test archived tasks leave hot reads but stay readable on request"""
+    db = MemoryBackend()
+    done, active = await db.create_tasks([("Done", None, True), ("Active", None, False)])
+    await db.create_task("Fresh", None, True)
+    db.tasks.rows[done]["updated_at"] -= timedelta(days=400)
+    db.tasks.rows[active]["updated_at"] -= timedelta(days=400)
+
+    assert await db.archive_tasks(datetime.utcnow() - timedelta(days=365)) == 1
+    assert await db.get_task(done) is None
+    assert (await db.get_archived_task(done))["title"] == "Done"
+    assert [task["title"] for task in await db.get_all_tasks()] == ["Active", "Fresh"]
+    everything = await db.get_all_tasks(include_archived=True, completed=True)
+    assert [task["title"] for task in everything] == ["Done", "Fresh"]
+    assert (await db.get_task_stats())["total"] == 2
+
+
+async def test_batch_modes():
+    """Test atomic batches apply nothing on failure and continue batches skip only the failures"""
+    db = MemoryBackend()
+    task_id = await db.create_task("Batched", None, False)
+    operations = [
+        {"op": "create", "title": "New", "description": None, "completed": False},
+        {"op": "patch", "id": task_id, "changes": {"completed": True}, "expected_version": 1},
+        # Stale after the patch above
+        {"op": "delete", "id": task_id, "expected_version": 1},
+    ]
+
+    committed, results = await db.run_batch(operations, atomic=True)
+    assert committed is False
+    assert results[-1] == {"id": task_id, "task": None, "error": "version_conflict"}
+    assert [task["id"] for task in await db.get_all_tasks()] == [task_id]
+
+    committed, results = await db.run_batch(operations, atomic=False)
+    assert committed is True
+    assert [result["error"] for result in results] == [None, None, "version_conflict"]
+    assert results[1]["task"]["version"] == 2
+    tasks = await db.get_all_tasks()
+    assert [(task["title"], task["completed"]) for task in tasks] == [("Batched", True), ("New", False)]
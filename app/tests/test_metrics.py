@@ -0,0 +1,100 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import metrics
+from metrics import Counter, Gauge, GaugeCallback, Histogram, timed
+
+
+@pytest.fixture(autouse=True)
+def isolated_registry(monkeypatch):
+    """Keep metrics created by a test out of the shared registry"""
+    monkeypatch.setattr(metrics, "_registry", [])
+
+
+def test_counter_with_labels():
+    """Test counting per label value"""
+    counter = Counter("jobs", "Jobs run", ("queue",))
+    counter.labels("fast").inc()
+    counter.labels("fast").inc(2)
+    counter.labels("slow").inc()
+    assert counter.labels("fast").value == 3
+    text = metrics.render()
+    assert "# TYPE jobs_total counter" in text
+    assert 'jobs_total{queue="fast"} 3.0' in text
+    assert 'jobs_total{queue="slow"} 1.0' in text
+
+
+def test_metadata_names_the_samples():
+    """Test that every HELP and TYPE line names the samples that follow it"""
+    Counter("jobs", "Jobs run").inc()
+    Gauge("in_flight", "In flight").set(1)
+    family = None
+    for line in metrics.render().splitlines():
+        if line.startswith("# TYPE "):
+            family = line.split()[2]
+        elif not line.startswith("#"):
+            assert line.split("{")[0].split()[0] == family
+
+
+def test_gauge_inc_dec_set():
+    """Test moving a gauge up and down"""
+    gauge = Gauge("in_flight", "In flight")
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+    assert "in_flight 1.0" in metrics.render()
+    gauge.set(7)
+    assert "in_flight 7.0" in metrics.render()
+
+
+def test_gauge_callback_reads_at_render():
+    """Test that callback gauges are evaluated on every scrape"""
+    values = {("primary", "idle"): 2}
+    GaugeCallback("pool", "Pool", lambda: values, ("pool", "state"))
+    assert 'pool{pool="primary",state="idle"} 2.0' in metrics.render()
+    values[("primary", "idle")] = 5
+    assert 'pool{pool="primary",state="idle"} 5.0' in metrics.render()
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test bucket counts, sum and count"""
+    histogram = Histogram("latency", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    text = metrics.render()
+    assert 'latency_bucket{le="0.1"} 2' in text
+    assert 'latency_bucket{le="1.0"} 3' in text
+    assert 'latency_bucket{le="+Inf"} 4' in text
+    assert "latency_sum 2.65" in text
+    assert "latency_count 4" in text
+
+
+def test_label_values_are_escaped():
+    """Test escaping quotes and backslashes in label values"""
+    Counter("errors", "Errors", ("path",)).labels('a"b\\c').inc()
+    assert 'errors_total{path="a\\"b\\\\c"} 1.0' in metrics.render()
+
+
+async def test_timed_records_latency_and_errors():
+    """Test the Database method decorator"""
+    class Store:
+        @timed
+        async def lookup(self, fail):
+            if fail:
+                raise ValueError("boom")
+            return 42
+
+    store = Store()
+    duration = metrics.DB_QUERY_DURATION.labels("lookup")
+    errors = metrics.DB_QUERY_ERRORS.labels("lookup")
+    calls, failures = sum(duration.counts), errors.value
+
+    assert await store.lookup(False) == 42
+    with pytest.raises(ValueError):
+        await store.lookup(True)
+    assert sum(duration.counts) == calls + 2
+    assert errors.value == failures + 1
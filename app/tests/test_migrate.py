@@ -0,0 +1,89 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import migrate
+from migrate import MIGRATIONS_DIR, latest_version, load_migrations
+
+
+def test_shipped_migrations_load_in_order():
+    """Test that the bundled migrations parse and are ordered by version"""
+    migrations = load_migrations()
+    versions = [migration.version for migration in migrations]
+    assert versions == sorted(versions)
+    assert versions[0] == 1
+    assert latest_version() == versions[-1]
+
+
+def test_no_transaction_migration_is_split(tmp_path):
+    """Test that no-transaction migrations run statement by statement"""
+    (tmp_path / "0001_first.sql").write_text("CREATE TABLE a (id INT);\n")
+    (tmp_path / "0002_index.sql").write_text(
+        "-- migrate: no-transaction\n"
+        "-- comment lines are dropped\n"
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS a_id ON a (id);\n"
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS a_id2 ON a (id);\n"
+    )
+    first, second = load_migrations(tmp_path)
+    assert first.transactional
+    assert not second.transactional
+    assert second.statements() == [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS a_id ON a (id)",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS a_id2 ON a (id)",
+    ]
+
+
+def test_bad_migration_names_are_rejected(tmp_path):
+    """Test that files not named NNNN_name.sql are refused"""
+    (tmp_path / "add-things.sql").write_text("SELECT 1;")
+    with pytest.raises(ValueError):
+        load_migrations(tmp_path)
+
+
+def test_bundled_no_transaction_migrations_have_no_function_bodies():
+    """Test that statement splitting is safe for the shipped no-transaction files"""
+    for migration in load_migrations(MIGRATIONS_DIR):
+        if not migration.transactional:
+            assert "$$" not in migration.sql
+
+
+class FakeConnection:
+    """Records statements; answers the lock and index-validity queries from queues"""
+
+    def __init__(self, locks=(True,), validity=()):
+        self.locks = list(locks)
+        self.validity = list(validity)
+        self.statements = []
+
+    async def execute(self, query, *args):
+        self.statements.append(" ".join(query.split()))
+
+    async def fetch(self, query, *args):
+        return []
+
+    async def fetchval(self, query, *args):
+        if "pg_try_advisory_lock" in query:
+            return self.locks.pop(0)
+        return self.validity.pop(0)
+
+
+async def test_migration_lock_is_polled(tmp_path, monkeypatch):
+    """Test that a held migration lock is retried rather than waited on"""
+    monkeypatch.setattr(migrate, "MIGRATION_LOCK_POLL_INTERVAL", 0)
+    conn = FakeConnection(locks=[False, False, True])
+    assert await migrate.migrate(conn, tmp_path) == []
+    assert conn.locks == []
+    assert not any("pg_advisory_lock" in statement for statement in conn.statements)
+
+
+async def test_invalid_concurrent_index_is_rebuilt(tmp_path):
+    """Test that an index left invalid by an interrupted build is dropped and built again"""
+    statement = "CREATE INDEX CONCURRENTLY IF NOT EXISTS a_id ON a (id)"
+    (tmp_path / "0001_index.sql").write_text(f"-- migrate: no-transaction\n{statement};\n")
+    conn = FakeConnection(validity=[False, True])
+    assert await migrate.migrate(conn, tmp_path) == [1]
+    ran = [s for s in conn.statements if "INDEX" in s]
+    assert ran == [statement, "DROP INDEX CONCURRENTLY IF EXISTS a_id", statement]
@@ -1,3 +1,5 @@
+import asyncio
+import json
 import pytest
 from unittest.mock import AsyncMock, patch
 from httpx import AsyncClient
@@ -7,6 +9,7 @@ from pathlib import Path
 # Add parent directory to path to import app modules
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from main import app
+from db import CursorExpiredError, PoolTimeoutError
 
 # Mark all tests in this file as async
 pytestmark = pytest.mark.asyncio
@@ -97,7 +100,7 @@ async def test_create_task(client, mock_db):
 async def test_update_task(client, mock_db):
     """Test updating a task"""
     # Mock database response
-    mock_db.update_task = AsyncMock(return_value=True)
+    mock_db.update_task = AsyncMock(return_value=2)
     mock_db.get_task = AsyncMock(return_value={
         "id": 1,
         "title": "Updated Task",
@@ -117,6 +120,8 @@ async def test_update_task(client, mock_db):
     assert data["id"] == 1
     assert data["title"] == "Updated Task"
     assert data["completed"] is True
+    assert data["version"] == 2
+    assert response.headers["ETag"] == '"1.2"'
     
     # Verify database method was called with correct parameters
     mock_db.update_task.assert_called_once_with(1, "Updated Task", "Updated Description", True)
@@ -125,7 +130,7 @@ async def test_update_task(client, mock_db):
 async def test_update_task_not_found(client, mock_db):
     """Test updating a task that doesn't exist"""
     # Mock database returning False (task not found)
-    mock_db.update_task = AsyncMock(return_value=False)
+    mock_db.update_task = AsyncMock(return_value=None)
     
     update_data = {
         "title": "Updated Task",
@@ -191,3 +196,601 @@ async def test_get_empty_tasks_list(client, mock_db):
     assert isinstance(data, list)
     assert len(data) == 0
 
+
+
+async def test_get_tasks_pagination_cursor(client, mock_db):
+    """Test that a full page returns the next cursor header"""
+    # Mock database returning one row more than the requested page size
+    mock_db.get_all_tasks = AsyncMock(return_value=[
+        {"id": 1, "title": "Task 1", "description": None, "completed": False},
+        {"id": 2, "title": "Task 2", "description": None, "completed": False},
+        {"id": 3, "title": "Task 3", "description": None, "completed": False}
+    ])
+
+    response = await client.get("/tasks?limit=2&after_id=0")
+    assert response.status_code == 200
+    data = response.json()
+    assert [task["id"] for task in data] == [1, 2]
+    assert response.headers["X-Next-Cursor"] == "2"
+
+    # Verify the extra row was requested
+    mock_db.get_all_tasks.assert_called_once_with(
+        after_id=0, limit=3, completed=None, created_after=None
+    )
+
+
+async def test_get_tasks_last_page_has_no_cursor(client, mock_db):
+    """Test that the last page omits the next cursor header"""
+    mock_db.get_all_tasks = AsyncMock(return_value=[
+        {"id": 5, "title": "Task 5", "description": None, "completed": True}
+    ])
+
+    response = await client.get("/tasks?limit=2&after_id=4&completed=true")
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert "X-Next-Cursor" not in response.headers
+    assert mock_db.get_all_tasks.call_args.kwargs["completed"] is True
+
+
+async def test_get_tasks_invalid_limit(client, mock_db):
+    """Test that out-of-range page sizes are rejected"""
+    mock_db.get_all_tasks = AsyncMock(return_value=[])
+
+    response = await client.get("/tasks?limit=0")
+    assert response.status_code == 422
+    mock_db.get_all_tasks.assert_not_called()
+
+
+def _batches(*batches):
+    """Build a mock iter_tasks that yields the given batches"""
+    async def iter_tasks(**kwargs):
+        for batch in batches:
+            yield batch
+    return iter_tasks
+
+
+async def test_export_tasks_ndjson(client, mock_db):
+    """Test streaming tasks as NDJSON"""
+    mock_db.iter_tasks = _batches(
+        [{"id": 1, "title": "Task 1", "description": None, "completed": False}],
+        [{"id": 2, "title": "Task 2", "description": "Desc 2", "completed": True}]
+    )
+
+    response = await client.get("/tasks/export")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = response.text.splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[1])["title"] == "Task 2"
+
+
+async def test_export_tasks_csv(client, mock_db):
+    """Test streaming tasks as CSV"""
+    mock_db.iter_tasks = _batches(
+        [{"id": 1, "title": "Task, with comma", "description": None, "completed": False}]
+    )
+
+    response = await client.get("/tasks/export?format=csv")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    lines = response.text.splitlines()
+    assert lines[0] == "id,title,description,completed"
+    assert lines[1] == '1,"Task, with comma",,False'
+
+
+async def test_export_tasks_unknown_format(client, mock_db):
+    """Test that unsupported export formats are rejected"""
+    response = await client.get("/tasks/export?format=xml")
+    assert response.status_code == 422
+
+
+async def test_create_tasks_bulk_json(client, mock_db):
+    """Test bulk creating tasks from a JSON array"""
+    mock_db.create_tasks = AsyncMock(return_value=[10, 11])
+
+    response = await client.post("/tasks/bulk", json=[
+        {"title": "Bulk 1"},
+        {"title": "Bulk 2", "description": "Second", "completed": True}
+    ])
+    assert response.status_code == 201
+    assert response.json() == {"ids": [10, 11]}
+    mock_db.create_tasks.assert_called_once_with([
+        ("Bulk 1", None, False),
+        ("Bulk 2", "Second", True)
+    ])
+
+
+async def test_create_tasks_bulk_ndjson(client, mock_db):
+    """Test bulk creating tasks from an NDJSON stream"""
+    mock_db.create_tasks = AsyncMock(return_value=[1, 2, 3])
+
+    body = "\n".join(json.dumps({"title": f"Line {i}"}) for i in range(3)) + "\n"
+    response = await client.post(
+        "/tasks/bulk",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 201
+    assert response.json()["ids"] == [1, 2, 3]
+    assert len(mock_db.create_tasks.call_args.args[0]) == 3
+
+
+async def test_create_tasks_bulk_invalid_item(client, mock_db):
+    """Test that validation errors point at the offending item"""
+    mock_db.create_tasks = AsyncMock(return_value=[])
+
+    response = await client.post("/tasks/bulk", json=[{"title": "Good"}, {"description": "No title"}])
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][:2] == ["body", 1]
+    mock_db.create_tasks.assert_not_called()
+
+
+async def test_create_tasks_bulk_too_large(client, mock_db):
+    """Test that oversized bulk requests are rejected"""
+    mock_db.create_tasks = AsyncMock(return_value=[])
+
+    with patch("main.BULK_MAX_BATCH", 2):
+        response = await client.post("/tasks/bulk", json=[{"title": "T"}] * 3)
+    assert response.status_code == 413
+    mock_db.create_tasks.assert_not_called()
+
+
+async def test_update_tasks_bulk(client, mock_db):
+    """Test bulk updating tasks with per-id results"""
+    mock_db.update_tasks = AsyncMock(return_value=[1])
+
+    response = await client.patch("/tasks/bulk", json=[
+        {"id": 1, "title": "Closed", "completed": True},
+        {"id": 2, "title": "Missing"}
+    ])
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"id": 1, "status": "updated"},
+        {"id": 2, "status": "not_found"}
+    ]
+    mock_db.update_tasks.assert_called_once_with([
+        (1, "Closed", None, True),
+        (2, "Missing", None, False)
+    ])
+
+
+async def test_update_tasks_bulk_duplicate_ids(client, mock_db):
+    """Test that duplicate ids in a bulk update are rejected"""
+    mock_db.update_tasks = AsyncMock(return_value=[])
+
+    response = await client.patch("/tasks/bulk", json=[
+        {"id": 1, "title": "A"},
+        {"id": 1, "title": "B"}
+    ])
+    assert response.status_code == 422
+    mock_db.update_tasks.assert_not_called()
+
+
+async def test_delete_tasks_bulk(client, mock_db):
+    """Test bulk deleting tasks with per-id results"""
+    mock_db.delete_tasks = AsyncMock(return_value=[3])
+
+    response = await client.request("DELETE", "/tasks/bulk", json={"ids": [3, 4]})
+    assert response.status_code == 200
+    assert response.json()["results"] == [
+        {"id": 3, "status": "deleted"},
+        {"id": 4, "status": "not_found"}
+    ]
+    mock_db.delete_tasks.assert_called_once_with([3, 4])
+
+
+async def test_stats(client, mock_db):
+    """Test exposing cache counters"""
+    mock_db.stats.return_value = {"cache": {"hits": 5, "misses": 1}, "listener": None}
+
+    response = await client.get("/stats")
+    assert response.status_code == 200
+    assert response.json()["cache"]["hits"] == 5
+
+
+async def test_get_task_etag_not_modified(client, mock_db):
+    """Test conditional GET of a task answering 304"""
+    mock_db.get_task = AsyncMock(return_value={
+        "id": 1, "title": "Versioned", "description": None, "completed": False, "version": 3
+    })
+
+    response = await client.get("/tasks/1")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"1.3"'
+    assert response.json()["version"] == 3
+
+    response = await client.get("/tasks/1", headers={"If-None-Match": '"1.3"'})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = await client.get("/tasks/1", headers={"If-None-Match": '"1.2"'})
+    assert response.status_code == 200
+
+
+async def test_get_tasks_etag_not_modified(client, mock_db):
+    """Test conditional GET of a task list answering 304"""
+    mock_db.get_all_tasks = AsyncMock(return_value=[
+        {"id": 1, "title": "Task 1", "description": None, "completed": False, "version": 1},
+        {"id": 2, "title": "Task 2", "description": None, "completed": True, "version": 4}
+    ])
+
+    response = await client.get("/tasks")
+    etag = response.headers["ETag"]
+
+    response = await client.get("/tasks", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+
+    mock_db.get_all_tasks.return_value[1]["version"] = 5
+    response = await client.get("/tasks", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+async def test_update_task_if_match(client, mock_db):
+    """Test that PUT with a current If-Match passes the expected version"""
+    mock_db.update_task = AsyncMock(return_value=4)
+
+    response = await client.put(
+        "/tasks/1",
+        json={"title": "Guarded", "completed": True},
+        headers={"If-Match": '"1.3"'}
+    )
+    assert response.status_code == 200
+    assert response.json()["version"] == 4
+    assert response.headers["ETag"] == '"1.4"'
+    mock_db.update_task.assert_called_once_with(1, "Guarded", None, True, expected_version=3)
+
+
+async def test_update_task_if_match_stale(client, mock_db):
+    """Test that PUT with a stale If-Match answers 412"""
+    mock_db.update_task = AsyncMock(return_value=None)
+    mock_db.get_task = AsyncMock(return_value={
+        "id": 1, "title": "Moved on", "description": None, "completed": False, "version": 5
+    })
+
+    response = await client.put("/tasks/1", json={"title": "Stale"}, headers={"If-Match": '"1.3"'})
+    assert response.status_code == 412
+
+
+async def test_delete_task_if_match_stale(client, mock_db):
+    """Test that DELETE with a stale or foreign If-Match answers 412"""
+    mock_db.delete_task = AsyncMock(return_value=False)
+    mock_db.get_task = AsyncMock(return_value={
+        "id": 1, "title": "Moved on", "description": None, "completed": False, "version": 5
+    })
+
+    response = await client.delete("/tasks/1", headers={"If-Match": '"1.3"'})
+    assert response.status_code == 412
+
+    response = await client.delete("/tasks/1", headers={"If-Match": '"2.5"'})
+    assert response.status_code == 412
+    mock_db.delete_task.assert_called_once_with(1, expected_version=3)
+
+
+async def test_metrics(client, mock_db):
+    """Test Prometheus metrics labelled by route template"""
+    mock_db.get_task = AsyncMock(return_value=None)
+    mock_db.pool_connections.return_value = {("primary", "open"): 3, ("primary", "idle"): 2}
+
+    await client.get("/tasks/12345")
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/tasks/{task_id}",status="404"}' in text
+    assert "/tasks/12345" not in text
+    assert 'db_pool_connections{pool="primary",state="idle"} 2.0' in text
+    assert 'http_requests_in_flight{method="GET",route="/tasks/{task_id}"}' in text
+
+
+async def test_server_timing_header(client, mock_db):
+    """Test reporting database and application time per request"""
+    mock_db.get_task = AsyncMock(return_value={
+        "id": 1, "title": "Timed", "description": None, "completed": False, "version": 1
+    })
+
+    response = await client.get("/tasks/1")
+    assert response.status_code == 200
+    assert response.headers["Server-Timing"].startswith("db-wait;dur=0.00, db;dur=0.00")
+
+
+async def test_pool_timeout_returns_503(client, mock_db):
+    """Test an exhausted connection pool sheds the request"""
+    mock_db.get_task = AsyncMock(side_effect=PoolTimeoutError("no primary connection free"))
+
+    response = await client.get("/tasks/1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+async def test_task_changes(client, mock_db):
+    """Test the change feed returns changes, tombstones and an opaque cursor"""
+    mock_db.get_changes = AsyncMock(return_value={
+        "changes": [{"id": 2, "title": "Changed", "description": None, "completed": True, "version": 2}],
+        "deleted": [7],
+        "position": (1234, 0),
+        "has_more": False,
+    })
+
+    response = await client.get("/tasks/changes")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["changes"][0]["id"] == 2
+    assert data["deleted"] == [7]
+    assert data["has_more"] is False
+    mock_db.get_changes.assert_called_once_with((0, 0), 100)
+
+    response = await client.get(f"/tasks/changes?since={data['cursor']}&limit=10")
+    assert response.status_code == 200
+    mock_db.get_changes.assert_called_with((1234, 0), 10)
+
+
+async def test_task_changes_bad_or_expired_cursor(client, mock_db):
+    """Test rejecting malformed cursors and expired ones"""
+    response = await client.get("/tasks/changes?since=not-a-cursor")
+    assert response.status_code == 400
+
+    mock_db.get_changes = AsyncMock(side_effect=CursorExpiredError((5, 0)))
+    response = await client.get("/tasks/changes?since=NS4w")
+    assert response.status_code == 410
+
+
+async def test_stream_renders_server_sent_events(mock_db):
+    """Test task events rendered as SSE, ending on eviction"""
+    import main
+
+    stream = main._sse_events(None)
+    first = asyncio.ensure_future(stream.__anext__())
+    await asyncio.sleep(0)
+    main.events.publish("UPDATE", 42)
+    chunk = await first
+    assert "event: updated\n" in chunk
+    assert 'data: {"id":42}\n\n' in chunk
+    assert chunk.startswith(f"id: {main.events.epoch}-")
+    await stream.aclose()
+    assert main.events.stats()["subscribers"] == 0
+
+
+async def test_stream_rejects_when_full(client, mock_db):
+    """Test 503 once the subscriber limit is reached"""
+    import main
+
+    with patch.object(main.events, "max_subscribers", 0):
+        response = await client.get("/tasks/stream")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+async def test_get_tasks_fields_projection(client, mock_db):
+    """Test narrowing the list query and response to the requested fields"""
+    mock_db.get_all_tasks = AsyncMock(return_value=[
+        {"id": 1, "title": "Narrow", "version": 2},
+    ])
+
+    response = await client.get("/tasks?fields=title")
+    assert response.status_code == 200
+    assert response.json() == [{"id": 1, "title": "Narrow"}]
+    assert "ETag" in response.headers
+    assert mock_db.get_all_tasks.call_args.kwargs["columns"] == ("id", "title", "version")
+
+
+async def test_get_task_fields_projection(client, mock_db):
+    """Test projecting a single task and rejecting unknown fields"""
+    mock_db.get_task = AsyncMock(return_value={
+        "id": 1, "title": "Narrow", "description": "x" * 1000, "completed": True, "version": 4
+    })
+
+    response = await client.get("/tasks/1?fields=completed,version")
+    assert response.status_code == 200
+    assert response.json() == {"id": 1, "completed": True, "version": 4}
+    projected = response.headers["ETag"]
+    assert projected.startswith('"1.4-') and projected != '"1.4"'
+
+    # Each representation only validates against its own tag
+    response = await client.get("/tasks/1", headers={"If-None-Match": projected})
+    assert response.status_code == 200
+    response = await client.get("/tasks/1?fields=completed,version", headers={"If-None-Match": projected})
+    assert response.status_code == 304
+
+    # The version in a projection's tag still works as a precondition
+    mock_db.delete_task = AsyncMock(return_value=True)
+    response = await client.delete("/tasks/1", headers={"If-Match": projected})
+    assert response.status_code == 200
+    mock_db.delete_task.assert_called_once_with(1, expected_version=4)
+
+    response = await client.get("/tasks/1?fields=title,password")
+    assert response.status_code == 400
+
+
+async def test_patch_task_sends_only_changed_fields(client, mock_db):
+    """Test PATCH passes only the fields sent and returns the updated task"""
+    mock_db.patch_task = AsyncMock(return_value={
+        "id": 1, "title": "Old title", "description": None, "completed": True, "version": 3
+    })
+
+    response = await client.patch("/tasks/1", json={"completed": True, "description": None})
+    assert response.status_code == 200
+    assert response.json()["completed"] is True
+    assert response.headers["ETag"] == '"1.3"'
+    mock_db.patch_task.assert_called_once_with(
+        1, {"completed": True, "description": None}, expected_version=None
+    )
+
+
+async def test_patch_task_validation_and_conditions(client, mock_db):
+    """Test PATCH rejects nulls for required fields and honours If-Match"""
+    response = await client.patch("/tasks/1", json={"title": None})
+    assert response.status_code == 422
+
+    mock_db.patch_task = AsyncMock(return_value=None)
+    mock_db.get_task = AsyncMock(return_value={
+        "id": 1, "title": "Moved on", "description": None, "completed": False, "version": 5
+    })
+    response = await client.patch("/tasks/1", json={"title": "Mine"}, headers={"If-Match": '"1.4"'})
+    assert response.status_code == 412
+    mock_db.patch_task.assert_called_once_with(1, {"title": "Mine"}, expected_version=4)
+
+    mock_db.get_task = AsyncMock(return_value=None)
+    response = await client.patch("/tasks/1", json={"title": "Gone"})
+    assert response.status_code == 404
+
+
+async def test_patch_query_whitelist():
+    """Test partial-update SQL is only built from whitelisted columns, once per column set"""
+    from db import _patch_task_query
+
+    query = _patch_task_query(("completed", "title"))
+    assert "SET completed = $1, title = $2, version = version + 1" in query
+    assert "WHERE id = $3 AND ($4::int IS NULL OR version = $4)" in query
+    assert _patch_task_query(("completed", "title")) is query
+    with pytest.raises(ValueError):
+        _patch_task_query(("id",))
+    with pytest.raises(ValueError):
+        _patch_task_query(("title; DROP TABLE tasks",))
+
+
+async def test_get_records_filtered(client, mock_db):
+    """Test listing records with filters and a next-page cursor"""
+    mock_db.get_all_test_records = AsyncMock(return_value=[
+        {"id": 1, "name": "Ann", "city": "Austin", "state": "TX", "occupation": "Nurse"},
+        {"id": 4, "name": "Bob", "city": "Dallas", "state": "TX", "occupation": "Nurse"},
+    ])
+
+    response = await client.get("/records?state=TX&occupation=Nurse&limit=1")
+    assert response.status_code == 200
+    assert [record["id"] for record in response.json()] == [1]
+    assert response.headers["X-Next-Cursor"] == "1"
+    mock_db.get_all_test_records.assert_called_once_with(
+        after_id=None, limit=2, state="TX", city=None, occupation="Nurse"
+    )
+
+
+async def test_record_crud(client, mock_db):
+    """Test creating, reading, updating and deleting a record"""
+    mock_db.create_test_record = AsyncMock(return_value=7)
+    response = await client.post("/records", json={"name": "Cy", "city": "Reno", "state": "NV", "occupation": "Chef"})
+    assert response.status_code == 201
+    assert response.json()["id"] == 7
+    mock_db.create_test_record.assert_called_once_with("Cy", "Reno", "NV", "Chef")
+
+    mock_db.get_test_record = AsyncMock(return_value=None)
+    assert (await client.get("/records/7")).status_code == 404
+
+    mock_db.update_test_record = AsyncMock(return_value=True)
+    response = await client.put("/records/7", json={"name": "Cy", "city": "Elko", "state": "NV", "occupation": "Chef"})
+    assert response.status_code == 200
+    assert response.json()["city"] == "Elko"
+
+    mock_db.delete_test_record = AsyncMock(return_value=False)
+    assert (await client.delete("/records/7")).status_code == 404
+
+
+async def test_record_facets(client, mock_db):
+    """Test facet counts by state and occupation"""
+    mock_db.get_test_facets = AsyncMock(return_value={
+        "state": [{"value": "TX", "count": 2}, {"value": None, "count": 1}],
+        "occupation": [{"value": "Nurse", "count": 3}],
+    })
+
+    response = await client.get("/records/facets")
+    assert response.status_code == 200
+    assert response.json()["state"][1] == {"value": None, "count": 1}
+
+
+async def test_task_stats(client, mock_db):
+    """Test task counts come straight from the backend's counters"""
+    mock_db.get_task_stats = AsyncMock(return_value={"total": 5, "completed": 2, "open": 3})
+
+    response = await client.get("/tasks/stats")
+    assert response.status_code == 200
+    assert response.json() == {"total": 5, "completed": 2, "open": 3}
+    mock_db.get_all_tasks.assert_not_called()
+
+
+async def test_archived_tasks_only_when_requested(client, mock_db):
+    """Test archived tasks are read only with include_archived"""
+    mock_db.get_task = AsyncMock(return_value=None)
+    mock_db.get_archived_task = AsyncMock(return_value={
+        "id": 3, "title": "Old", "description": None, "completed": True, "version": 4
+    })
+
+    assert (await client.get("/tasks/3")).status_code == 404
+    mock_db.get_archived_task.assert_not_called()
+    response = await client.get("/tasks/3?include_archived=true")
+    assert response.status_code == 200
+    assert response.json()["title"] == "Old"
+
+    mock_db.get_all_tasks = AsyncMock(return_value=[])
+    await client.get("/tasks?include_archived=true")
+    assert mock_db.get_all_tasks.call_args.kwargs["include_archived"] is True
+
+
+async def test_deadline_exceeded_returns_504(client, mock_db):
+    """Test requests that run out of time fail with 504"""
+    from deadline import DeadlineExceeded
+
+    mock_db.get_task = AsyncMock(side_effect=DeadlineExceeded("query"))
+    response = await client.get("/tasks/1", headers={"X-Request-Timeout": "0.5"})
+    assert response.status_code == 504
+    assert response.json()["detail"] == "Request deadline exceeded"
+
+
+async def test_batch_passes_operations_in_order(client, mock_db):
+    """Test batch operations reach the backend in order and map to per-operation statuses"""
+    mock_db.run_batch = AsyncMock(return_value=(True, [
+        {"id": 7, "task": {"id": 7, "title": "New", "description": None, "completed": False, "version": 1},
+         "error": None},
+        {"id": 3, "task": None, "error": None},
+        {"id": 4, "task": None, "error": "version_conflict"},
+    ]))
+
+    response = await client.post("/batch", json={"mode": "continue", "operations": [
+        {"op": "create", "task": {"title": "New"}},
+        {"op": "delete", "id": 3},
+        {"op": "patch", "id": 4, "changes": {"completed": True}, "version": 2},
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["committed"] is True
+    assert [result["status"] for result in body["results"]] == [201, 204, 412]
+    assert body["results"][0]["task"]["title"] == "New"
+
+    operations = mock_db.run_batch.call_args.args[0]
+    assert [operation["op"] for operation in operations] == ["create", "delete", "patch"]
+    assert operations[2]["changes"] == {"completed": True}
+    assert operations[2]["expected_version"] == 2
+    assert mock_db.run_batch.call_args.kwargs["atomic"] is False
+
+
+async def test_atomic_batch_failure_rolls_back(client, mock_db):
+    """Test a failed atomic batch answers 409 with every other operation marked rolled back"""
+    mock_db.run_batch = AsyncMock(return_value=(False, [
+        {"id": 1, "task": {"id": 1, "title": "A", "description": None, "completed": True, "version": 2},
+         "error": None},
+        {"id": 9, "task": None, "error": "not_found"},
+    ]))
+
+    response = await client.post("/batch", json={"operations": [
+        {"op": "update", "id": 1, "task": {"title": "A", "completed": True}},
+        {"op": "delete", "id": 9},
+        {"op": "create", "task": {"title": "Never"}},
+    ]})
+    assert response.status_code == 409
+    body = response.json()
+    assert body["committed"] is False
+    assert [result["status"] for result in body["results"]] == [424, 404, 424]
+    assert mock_db.run_batch.call_args.kwargs["atomic"] is True
+
+
+async def test_batch_validation(client, mock_db):
+    """Test malformed and oversized batches are rejected before touching the backend"""
+    mock_db.run_batch = AsyncMock()
+    response = await client.post("/batch", json={"operations": [{"op": "update", "id": 1}]})
+    assert response.status_code == 422
+    response = await client.post("/batch", json={"operations": [{"op": "patch", "id": 1, "changes": {}}]})
+    assert response.status_code == 422
+
+    with patch("main.BATCH_MAX_OPERATIONS", 1):
+        response = await client.post("/batch", json={"operations": [{"op": "delete", "id": 1}] * 2})
+    assert response.status_code == 413
+    mock_db.run_batch.assert_not_called()
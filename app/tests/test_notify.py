@@ -0,0 +1,34 @@
+import json
+import sys
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from notify import ChangeListener
+
+
+def _listener():
+    """Listener with recording callbacks"""
+    listener = ChangeListener("postgresql://unused")
+    changes = []
+    resets = []
+    listener.add_change_callback(lambda op, task_id: changes.append((op, task_id)))
+    listener.add_reset_callback(lambda: resets.append(True))
+    return listener, changes, resets
+
+
+def test_notification_dispatch():
+    """Test that notifications reach change callbacks"""
+    listener, changes, resets = _listener()
+    listener._on_notification(None, 1, "tasks_changed", json.dumps({"op": "UPDATE", "id": 7}))
+    assert changes == [("UPDATE", 7)]
+    assert resets == []
+    assert listener.notifications == 1
+
+
+def test_malformed_notification_resets():
+    """Test that an unreadable payload flushes subscribers"""
+    listener, changes, resets = _listener()
+    listener._on_notification(None, 1, "tasks_changed", "not json")
+    assert changes == []
+    assert resets == [True]
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import namedtuple
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from deadline import current_deadline
+from timing import RequestTiming, SlowQueryLog, current_timing, is_plain_read, param_shape
+
+LoggedQuery = namedtuple("LoggedQuery", "query args timeout elapsed exception conn_addr conn_params")
+
+
+def logged(query, args=(), elapsed=1.0, exception=None):
+    return LoggedQuery(query, args, None, elapsed, exception, None, None)
+
+
+def test_param_shape_hides_values():
+    """Test describing parameters by type and size only"""
+    assert param_shape(None) == "null"
+    assert param_shape("secret") == "str(6)"
+    assert param_shape([1, 2, 3]) == "list[3]"
+    assert param_shape(42) == "int"
+
+
+def test_server_timing_header():
+    """Test the Server-Timing header splits database and other time"""
+    timing = RequestTiming()
+    timing.db_wait = 0.002
+    timing.db_time = 0.010
+    timing.acquires = 2
+    header = timing.server_timing()
+    assert header.startswith('db-wait;dur=2.00, db;dur=10.00;desc="2 acquire(s)", app;dur=')
+    assert "total;dur=" in header
+
+
+def test_fast_queries_are_not_logged(caplog):
+    """Test that queries under the threshold are ignored"""
+    log = SlowQueryLog(threshold=0.5)
+    with caplog.at_level(logging.WARNING):
+        log.record(logged("SELECT 1", elapsed=0.1))
+    assert log.slow_queries == 0
+    assert not caplog.records
+
+
+def test_slow_query_logged_with_param_shapes(caplog):
+    """Test logging SQL, timing and parameter shapes but not values"""
+    log = SlowQueryLog(threshold=0.5)
+    with caplog.at_level(logging.WARNING):
+        log.record(logged("SELECT *\n  FROM tasks WHERE title = $1", ("hunter2",), elapsed=0.75))
+    assert log.slow_queries == 1
+    message = caplog.records[0].getMessage()
+    assert "750.0 ms" in message
+    assert "SELECT * FROM tasks WHERE title = $1" in message
+    assert "str(7)" in message
+    assert "hunter2" not in message
+
+
+def test_only_plain_reads_are_explainable():
+    """Test that SELECTs calling functions, which may have effects, are never explained"""
+    assert is_plain_read("SELECT id, title FROM tasks WHERE id = $1")
+    assert is_plain_read("SELECT id FROM (SELECT id FROM tasks UNION ALL SELECT id FROM tasks_archive) AS tasks")
+    assert is_plain_read("SELECT EXISTS (SELECT 1 FROM tasks WHERE (change_xid, id) > ($1, $2))")
+    assert not is_plain_read("SELECT create_task_partitions($1)")
+    assert not is_plain_read("SELECT pg_advisory_lock($1)")
+    assert not is_plain_read("WITH moved AS (DELETE FROM tasks RETURNING *) SELECT COUNT(*) FROM moved")
+    assert not is_plain_read("UPDATE tasks SET completed = true")
+
+
+async def test_explain_sampled_for_slow_selects_only():
+    """Test plans are captured for SELECTs, once per statement per interval"""
+    explained = []
+
+    async def explain(query, args):
+        explained.append(query)
+        return "Seq Scan on tasks"
+
+    log = SlowQueryLog(threshold=0.5, explain=explain, explain_interval=60)
+    log.record(logged("SELECT * FROM tasks"))
+    await asyncio.sleep(0)
+    log.record(logged("SELECT * FROM tasks"))
+    log.record(logged("UPDATE tasks SET completed = true"))
+    await log.close()
+    await asyncio.sleep(0)
+    assert explained == ["SELECT * FROM tasks"]
+    assert log.explains == 1
+    assert log.slow_queries == 3
+
+
+async def test_explain_runs_outside_the_slow_request():
+    """Test the sampled EXPLAIN carries neither the request's deadline nor its timing"""
+    seen = []
+
+    async def explain(query, args):
+        seen.append((current_deadline.get(), current_timing.get()))
+        return "Seq Scan on tasks"
+
+    log = SlowQueryLog(threshold=0.5, explain=explain)
+    deadline_token = current_deadline.set(time.monotonic() + 0.01)
+    timing_token = current_timing.set(RequestTiming())
+    try:
+        log.record(logged("SELECT * FROM tasks"))
+    finally:
+        current_deadline.reset(deadline_token)
+        current_timing.reset(timing_token)
+    await log._explain_task
+    assert seen == [(None, None)]
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import re
+import time
+import asyncpg
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Optional
+
+from deadline import detach
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTiming:
+    """Database time spent on behalf of one request"""
+
+    __slots__ = ("started", "db_wait", "db_time", "acquires")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # Waiting for a pooled connection
+        self.db_wait = 0.0
+        # Holding a connection: running queries and reading their results
+        self.db_time = 0.0
+        self.acquires = 0
+
+    def server_timing(self) -> str:
+        """Server-Timing header value; app is everything outside the database"""
+        total = time.perf_counter() - self.started
+        app = max(0.0, total - self.db_wait - self.db_time)
+        return (
+            f"db-wait;dur={self.db_wait * 1e3:.2f}, "
+            f'db;dur={self.db_time * 1e3:.2f};desc="{self.acquires} acquire(s)", '
+            f"app;dur={app * 1e3:.2f}, "
+            f"total;dur={total * 1e3:.2f}"
+        )
+
+
+# Set by ServerTimingMiddleware; None outside a request
+current_timing: ContextVar[Optional[RequestTiming]] = ContextVar("current_timing", default=None)
+
+
+# Words that may precede a parenthesis in a plain read without calling a function
+_SQL_KEYWORDS = frozenset({"SELECT", "FROM", "WHERE", "AND", "OR", "NOT", "IN", "EXISTS", "AS", "ON", "JOIN", "ALL"})
+_CALL = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+
+
+def is_plain_read(query: str) -> bool:
+    """Whether a statement is a SELECT that calls no functions
+
+    Anything else may have effects a rolled-back transaction doesn't undo:
+    SELECT create_task_partitions($1) runs DDL, and a session advisory lock
+    taken by SELECT pg_advisory_lock($1) outlives the rollback.
+    """
+    if query.lstrip()[:6].upper() != "SELECT":
+        return False
+    return all(name.upper() in _SQL_KEYWORDS for name in _CALL.findall(query))
+
+
+def param_shape(value) -> str:
+    """Describe a query parameter without revealing its value"""
+    if value is None:
+        return "null"
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+
+class SlowQueryLog:
+    """Logs queries slower than threshold seconds, optionally with their plan
+
+    Installed on every pooled connection as an asyncpg query logger. With
+    explain on, a slow plain read (see is_plain_read) is re-run under EXPLAIN (ANALYZE, BUFFERS) in a
+    rolled-back transaction, at most once per explain_interval seconds for
+    the same SQL and one at a time, so the sampling itself can't pile load
+    onto a struggling database.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        explain: Optional[Callable[[str, tuple], Awaitable[str]]] = None,
+        explain_interval: float = 300.0,
+    ):
+        self.threshold = threshold
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self._explained_at: Dict[str, float] = {}
+        self._explain_task: Optional[asyncio.Task] = None
+        self.slow_queries = 0
+        self.explains = 0
+
+    def install(self, conn: asyncpg.Connection):
+        conn.add_query_logger(self.record)
+
+    def record(self, record):
+        """Query logger callback, receiving an asyncpg LoggedQuery"""
+        if record.elapsed < self.threshold or record.query.lstrip()[:7].upper() == "EXPLAIN":
+            return
+        self.slow_queries += 1
+        logger.warning(
+            "Slow query (%.1f ms%s): %s params=[%s]",
+            record.elapsed * 1e3,
+            ", failed" if record.exception is not None else "",
+            " ".join(record.query.split()),
+            ", ".join(param_shape(arg) for arg in record.args),
+        )
+        if self._should_explain(record):
+            self._explained_at[record.query] = time.monotonic()
+            # Query loggers run in the slow request's context, whose deadline and timing don't cover this
+            self._explain_task = detach(self._log_plan(record.query, record.args))
+
+    def _should_explain(self, record) -> bool:
+        if self.explain is None or record.exception is not None:
+            return False
+        # EXPLAIN ANALYZE executes the statement, so only ever sample plain reads
+        if not is_plain_read(record.query):
+            return False
+        if self._explain_task is not None and not self._explain_task.done():
+            return False
+        explained_at = self._explained_at.get(record.query)
+        return explained_at is None or time.monotonic() - explained_at >= self.explain_interval
+
+    async def _log_plan(self, query: str, args: tuple):
+        try:
+            plan = await self.explain(query, args)
+        except Exception as exc:
+            logger.warning("EXPLAIN of slow query failed: %s", exc)
+            return
+        self.explains += 1
+        logger.warning("Plan for slow query: %s\n%s", " ".join(query.split()), plan)
+
+    async def close(self):
+        if self._explain_task is not None and not self._explain_task.done():
+            self._explain_task.cancel()
+            try:
+                await self._explain_task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict:
+        return {
+            "threshold_ms": self.threshold * 1e3,
+            "slow_queries": self.slow_queries,
+            "explains": self.explains,
+        }